@@ -3,11 +3,21 @@
 # Запуск: используется импортом из main.py
 
 import os
+import json
+import asyncio
 import logging
-from typing import Dict, Tuple, Optional
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple, Optional
+import httpx
+
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import SingleFlight, TTLCache
+from geo import KDTree
+from httpcache import make_etag
+from lazy import optional
+from quota import QuotaExceededError, QuotaLimiter, parse_retry_after
+from metrics import Counter, Gauge, upstream_inflight, upstream_latency, upstream_retries
 
 # Логирование
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
@@ -142,17 +152,154 @@ coord: Dict[str, Tuple[float, float]] = {
 
 }
 
-# URL API и ключ (ключ можно переопределить через переменную окружения WEATHERBIT_KEY)
+# Районы по областям (та же группировка, что и метки #=== в coord); ключ — код города из main.CITIES
+oblasts: Dict[str, Tuple[str, ...]] = {
+    "gomel": (
+        "br", "buda", "vetka", "gom", "dobrush", "elsk", "zhit", "zhlobin", "kalin", "korm", "lel",
+        "loev", "moz", "narovl", "oktyabr", "petr", "rech", "rogach", "svetl", "hoyniki",
+        "chechersk",
+    ),
+    "brest": (
+        "baran", "berezov", "brestsk", "gantsevich", "drogich", "zhabink", "ivan", "ivatsevich",
+        "kamenetsk", "kobrinsk", "luninetsk", "liahovich", "maloritsk", "pinsk", "pruzhansk",
+        "stolinsk",
+    ),
+    "grodno": (
+        "berestovitski", "volkovisski", "voronovski", "grodnenski", "dyatlovski", "zelvenski",
+        "ivevski", "korelichski", "lidski", "mostovski", "novogrudski", "ostrovetski", "oshmyanski",
+        "svislochski", "slonimski", "smorgonski", "schuchinski",
+    ),
+    "minsk": (
+        "berezenski", "borisovsk", "vileiski", "volozhinski", "dzherzhinsk", "kletsk", "kopilsk",
+        "krupsk", "logoiski", "lubansk", "minski", "molodechnensk", "miadelsk", "nesvizh",
+        "puhovichsk", "slutsk", "smolevichsk", "soligorsk", "starodorozhsk", "stolbtsovsk",
+        "uzdensk", "chervensk",
+    ),
+    "mogilev": (
+        "belinichski", "bobruisk", "bihovsk", "klichevski", "goretski", "dribinski", "kirovski",
+        "klimovichsk", "kostukovichski", "krasnopolsk", "krichevsk", "kruglyansk", "mstislavsk",
+        "mogilevsk", "osipovichski", "slavgorodski", "hotinski", "chausski", "cherikovsk",
+        "shklovski", "glusski",
+    ),
+    "vitebsk": (
+        "beshenkovichski", "braslavski", "verhnedvinski", "vitebski", "glubokski", "gorodokski",
+        "dokshitski", "dubrovenski", "lepelski", "lioznenski", "miorski", "orshanski", "polotski",
+        "postavski", "rossonski", "sennenski", "tolochinski", "ushachski", "chashnikski",
+        "sharkovschinski", "shumilinski",
+    ),
+}
+
+# Пространственный индекс районов: произвольные координаты в пределах SNAP_RADIUS_KM
+# от центра района привязываются к этому району (и его записи в кэше); 0 — не привязывать
+SNAP_RADIUS_KM = float(os.getenv("WEATHER_SNAP_RADIUS_KM", "15"))
+_districts = KDTree(coord)
+_oblast_of = {region_id: city for city, ids in oblasts.items() for region_id in ids}
+
+# URL API и ключ (можно переопределить через переменные окружения WEATHERBIT_URL и WEATHERBIT_KEY,
+# например, чтобы направить запросы на локальную заглушку из bench.py)
 DEFAULT_KEY = "7216cf5ae90f43f5815d50ddcf378c4f"
 key = os.getenv("WEATHERBIT_KEY", DEFAULT_KEY)
-url = "https://api.weatherbit.io/v2.0/current"
+url = os.getenv("WEATHERBIT_URL", "https://api.weatherbit.io/v2.0/current")
+# Иконки погоды отдаёт само приложение (/icons/<код>.png, см. icons.py), поле "icon" в данных — этот адрес
+ICON_PATH = "/icons/{}.png"
+
+# Сессия для синхронного data_url. Создаётся при первом вызове: обработчикам FastAPI requests не нужен,
+# и его импорт не замедляет старт приложения. Повторы при кратковременных ошибках — не в urllib3,
+# а в _get_sync_with_retries: как и в асинхронном клиенте, каждый повтор берёт токен квоты
+_session = None
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+
+        _session = requests.Session()
+    return _session
+
+# Асинхронный клиент с пулом соединений (для обработчиков FastAPI, чтобы не блокировать event loop)
+UPSTREAM_TIMEOUT = float(os.getenv("WEATHERBIT_TIMEOUT", "10"))      # таймаут одной попытки, сек
+UPSTREAM_DEADLINE = float(os.getenv("WEATHERBIT_DEADLINE", "15"))    # общий дедлайн запроса с повторами, сек
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("WEATHERBIT_MAX_CONNECTIONS", "20"))
+_RETRY_TOTAL = 3
+_RETRY_BACKOFF = 0.5
+_RETRY_STATUSES = (500, 502, 503, 504)
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+# Кэш текущей погоды: "current" у Weatherbit обновляется раз в 10–15 минут
+CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))            # время жизни записи, сек
+CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "512"))            # максимум записей (LRU)
+COORD_PRECISION = int(os.getenv("WEATHER_COORD_PRECISION", "2"))    # знаков после запятой для "lat,lon"
+_cache = TTLCache(CACHE_TTL, CACHE_SIZE)
+# Одновременные промахи по одному ключу ждут один общий запрос к API
+_flights = SingleFlight()
+# Просроченные данные моложе STALE_TTL отдаются сразу, а обновляются в фоне (stale-while-revalidate)
+STALE_TTL = float(os.getenv("WEATHER_STALE_TTL", "3600"))
+_background: set = set()   # ссылки на фоновые задачи, чтобы их не собрал GC
+# Выключатель: при высокой доле ошибок upstream запросы временно не выполняются,
+# а клиенту отдаются последние известные данные района с пометкой stale
+_breaker = CircuitBreaker(
+    failure_rate=float(os.getenv("WEATHER_BREAKER_FAILURE_RATE", "0.5")),
+    window=int(os.getenv("WEATHER_BREAKER_WINDOW", "20")),
+    min_calls=int(os.getenv("WEATHER_BREAKER_MIN_CALLS", "5")),
+    open_for=float(os.getenv("WEATHER_BREAKER_OPEN_SECONDS", "30")),
+)
+# Метрики кэша берутся из уже существующих счётчиков при выдаче /metrics
+Counter("weather_cache_hits_total", "Попадания в кэш погоды", fn=lambda: _cache.hits)
+Counter("weather_cache_misses_total", "Промахи кэша погоды", fn=lambda: _cache.misses)
+Gauge("weather_cache_entries", "Записей в кэше погоды", fn=lambda: len(_cache))
+Counter("weather_breaker_rejected_total", "Запросы, отклонённые выключателем", fn=lambda: _breaker.rejected)
+_stale_served = Counter("weather_stale_served_total", "Отдано устаревших данных", ("reason",))
 
-# Сессия с retry для надёжности (повторные попытки при кратковременных ошибках)
-_session = requests.Session()
-_retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
-_adapter = HTTPAdapter(max_retries=_retries)
-_session.mount("https://", _adapter)
-_session.mount("http://", _adapter)
+# Квота ключа Weatherbit: запросов в сутки и в минуту (0 — без ограничения; задайте по тарифу ключа).
+# Промахи пользователей важнее фонового обновления; при нехватке суточной квоты TTL кэша удлиняется
+_quota = QuotaLimiter(
+    daily=int(os.getenv("WEATHERBIT_DAILY_BUDGET", "0")),
+    per_minute=int(os.getenv("WEATHERBIT_MINUTE_BUDGET", "0")),
+    reserve=float(os.getenv("WEATHERBIT_BACKGROUND_RESERVE", "0.2")),
+    max_wait=float(os.getenv("WEATHERBIT_QUOTA_WAIT", "2")),
+)
+Gauge("weather_quota_daily_remaining", "Остаток суточной квоты API (-1 — без ограничения)",
+      fn=lambda: -1 if _quota.daily_left() is None else _quota.daily_left())
+Counter("weather_quota_rejected_total", "Запросы, не отправленные из-за квоты",
+        fn=lambda: _quota.rejected + _quota.rejected_background)
+
+# Общий для воркеров кэш второго уровня (L2): "memory" — только свой кэш процесса,
+# "sqlite" — плюс общий файл WEATHER_STORE_PATH с межпроцессной блокировкой на обновление района
+CACHE_BACKEND = os.getenv("WEATHER_CACHE_BACKEND", "memory").strip().lower()
+SHARED_LOCK_WAIT = float(os.getenv("WEATHER_SHARED_LOCK_WAIT", "5"))   # сколько ждать данных от другого воркера, сек
+_shared = None            # объект с get/save/try_lock/unlock (store.SnapshotStore), задаётся set_shared_backend
+_owner = f"pid-{os.getpid()}"
+# Подписчики на новые данные: fn(ключ кэша, данные, время получения) и флаг "и данные из общего L2-кэша"
+_listeners: List[Tuple[Callable[[str, dict, float], None], bool]] = []
+
+# Сколько районов пакетного запроса опрашиваются одновременно
+BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "8"))
+
+
+def encode_json(obj) -> bytes:
+    """Компактный JSON в UTF-8 (как у JSONResponse); orjson, если установлен, иначе стандартный json."""
+    orjson = optional("orjson")
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class Reading(dict):
+    """
+    Запись кэша: обычный dict с данными погоды плюс готовое JSON-тело, сильный ETag
+    и время получения из API (ts). Кодируется один раз при записи в кэш;
+    ответ по району — отдача уже готовых байтов.
+    """
+
+    __slots__ = ("body", "etag", "ts")
+
+    def __init__(self, data: dict, ts: float):
+        super().__init__(data)
+        self.body = encode_json(self)
+        self.etag = make_etag(self.body)
+        self.ts = ts
 
 
 def _parse_coords_from_str(s: str) -> Optional[Tuple[float, float]]:
@@ -175,16 +322,52 @@ def _parse_coords_from_str(s: str) -> Optional[Tuple[float, float]]:
     return None
 
 
-def data_url(region_id: str) -> dict:
+def init_client() -> None:
+    """Создать пул соединений к API заранее (при старте приложения), а не на первом запросе."""
+    _get_async_client()
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Ленивое создание общего httpx.AsyncClient с ограниченным пулом соединений."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS,
+            ),
+        )
+    return _async_client
+
+
+async def fetch_bytes(source: str) -> Tuple[bytes, str]:
+    """GET произвольного ресурса через общий пул соединений -> (тело, Content-Type). RuntimeError при ошибке."""
+    try:
+        resp = await _get_async_client().get(source)
+        resp.raise_for_status()
+    except httpx.HTTPError as exc:
+        logger.error("Не удалось загрузить %s: %s", source, exc)
+        raise RuntimeError(f"Ошибка сети: {exc}")
+    return resp.content, resp.headers.get("content-type", "")
+
+
+async def close_client() -> None:
+    """Закрыть асинхронный клиент (вызывается при остановке приложения)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def resolve_region(region_id: str) -> Tuple[str, Tuple[float, float]]:
     """
-    Возвращает словарь: {"temp": int, "descr": str, "icon": str}
-    Поддерживает:
-      - существующие ключи из coord (например 'gom', 'br' и т.д.)
-      - строку с координатами "lat,lon" (например "52.43,30.98")
-    Бросает ValueError если вход некорректен
-    Бросает RuntimeError при ошибках сети или некорректном ответе API
+    Преобразует region_id (ключ из coord или строку "lat,lon") в пару (ключ кэша, (lat, lon)).
+    Координаты ближе SNAP_RADIUS_KM к центру района дают ключ этого района,
+    остальные округляются до COORD_PRECISION знаков, чтобы близкие точки
+    попадали в одну запись кэша ("52.4312,30.981" и "52.43,30.98" -> "52.43,30.98").
+    Бросает ValueError если вход некорректен.
     """
-
     if not region_id or not isinstance(region_id, str):
         raise ValueError("Не указан region_id")
 
@@ -192,15 +375,118 @@ def data_url(region_id: str) -> dict:
 
     # Сначала проверяем — может быть ключ из словаря coord
     if region_id in coord:
-        lat, lon = coord[region_id]
-    else:
-        # Попробуем распарсить координаты из строки
-        parsed = _parse_coords_from_str(region_id)
-        if parsed is None:
-            raise ValueError("Неизвестный регион или некорректные координаты")
-        lat, lon = parsed
-
-    params = {
+        return region_id, coord[region_id]
+
+    # Попробуем распарсить координаты из строки
+    parsed = _parse_coords_from_str(region_id)
+    if parsed is None:
+        raise ValueError("Неизвестный регион или некорректные координаты")
+    # те же границы, что у /nearest: заведомо неверная точка не должна доходить до API
+    if not (-90 <= parsed[0] <= 90 and -180 <= parsed[1] <= 180):
+        raise ValueError("Координаты вне допустимого диапазона (lat от -90 до 90, lon от -180 до 180)")
+    if SNAP_RADIUS_KM > 0:
+        nearest = _districts.nearest(*parsed)
+        if nearest is not None and nearest[1] <= SNAP_RADIUS_KM:
+            return nearest[0], coord[nearest[0]]
+    lat, lon = round(parsed[0], COORD_PRECISION), round(parsed[1], COORD_PRECISION)
+    return f"{lat:.{COORD_PRECISION}f},{lon:.{COORD_PRECISION}f}", (lat, lon)
+
+
+def nearest_region(lat: float, lon: float) -> dict:
+    """Ближайший район из coord: {"region_id", "oblast", "distance_km", "snapped"}."""
+    region_id, dist = _districts.nearest(lat, lon)
+    return {
+        "region_id": region_id,
+        "oblast": _oblast_of.get(region_id),
+        "distance_km": round(dist, 2),
+        "snapped": SNAP_RADIUS_KM > 0 and dist <= SNAP_RADIUS_KM,
+    }
+
+
+def cache_stats() -> dict:
+    """Счётчики кэша текущей погоды (размер, попадания, промахи, вытеснения, запросы в полёте)."""
+    stats = _cache.stats()
+    stats.update(inflight=len(_flights), upstream_started=_flights.started, upstream_joined=_flights.joined)
+    return stats
+
+
+def add_listener(fn: Callable[[str, dict, float], None], shared: bool = True) -> None:
+    """
+    Вызывать fn(ключ, данные, время) после каждого успешного ответа API (например, для записи на диск).
+    При shared=True fn получает и данные, которые другой воркер положил в общий L2-кэш
+    (подписчики в памяти процесса: рассылка, сводки); shared=False — только свои ответы API.
+    """
+    _listeners.append((fn, shared))
+
+
+def icon_url(icon: str) -> str:
+    """Код иконки Weatherbit ("c01d") -> локальный адрес; готовый адрес и пустая строка не меняются."""
+    if not icon or "/" in icon:
+        return icon
+    return ICON_PATH.format(icon)
+
+
+def warm_cache(entries: Iterable[Tuple[str, dict, float]]) -> int:
+    """Заполнить кэш сохранёнными ранее записями (ключ, данные, время получения) без вызова подписчиков."""
+    count = 0
+    for cache_key, data, ts in entries:
+        entry = _cache.get_entry(cache_key)
+        if entry is None or time.time() - entry[1] < ts:
+            if data.get("icon") and "/" not in data["icon"]:
+                # снимок, сохранённый до перехода на локальные иконки
+                data = dict(data, icon=icon_url(data["icon"]))
+            _cache.set(cache_key, Reading(data, ts), stored_at=ts)
+            count += 1
+    return count
+
+
+def ttl_multiplier() -> float:
+    """Во сколько раз сейчас удлинён TTL кэша из-за остатка квоты API (1 — не удлинён)."""
+    return _quota.ttl_multiplier()
+
+
+def _fresh_ttl() -> float:
+    return CACHE_TTL * _quota.ttl_multiplier()
+
+
+def quota_status() -> dict:
+    """Остаток квоты API: за сутки, в текущей минуте, пауза по Retry-After, множитель TTL."""
+    status = _quota.status()
+    status["cache_ttl"] = _fresh_ttl()
+    return status
+
+
+def breaker_status() -> dict:
+    """Состояние выключателя upstream (closed / open / half_open) и счётчики."""
+    return _breaker.status()
+
+
+def set_shared_backend(backend) -> None:
+    """Подключить общий для воркеров L2-кэш (get, save, try_lock, unlock) или отключить его (None)."""
+    global _shared
+    _shared = backend
+
+
+def _notify(cache_key: str, data: Reading, from_shared: bool = False) -> None:
+    for fn, shared in _listeners:
+        if from_shared and not shared:
+            continue
+        try:
+            fn(cache_key, data, data.ts)
+        except Exception:
+            logger.exception("Ошибка в подписчике на обновление %s", cache_key)
+
+
+def _store(cache_key: str, data: dict) -> Reading:
+    ts = time.time()
+    data = Reading(data, ts)
+    _cache.set(cache_key, data, stored_at=ts)
+    _notify(cache_key, data)
+    return data
+
+
+def _params(lat: float, lon: float) -> dict:
+    return {
         "lat": lat,
         "lon": lon,
         "key": key,
@@ -208,18 +494,9 @@ def data_url(region_id: str) -> dict:
         "units": "M",
     }
 
-    try:
-        resp = _session.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        payload = resp.json()
-    except requests.exceptions.RequestException as exc:
-        # Сетевая ошибка или таймаут
-        logger.error("Сетевая ошибка: %s", exc)
-        raise RuntimeError(f"Ошибка сети: {exc}")
-    except ValueError as exc:
-        logger.error("Невалидный JSON: %s", exc)
-        raise RuntimeError(f"Невалидный JSON: {exc}")
 
+def _parse_payload(payload) -> dict:
+    """Достаёт из ответа Weatherbit словарь {"city", "temp", "descr", "icon", "code"}."""
     if not isinstance(payload, dict) or "data" not in payload or not payload["data"]:
         raise RuntimeError("Неверный ответ от API: отсутствует поле data")
 
@@ -232,7 +509,402 @@ def data_url(region_id: str) -> dict:
 
     weather = item.get("weather") or {}
     descr = weather.get("description") or "-"
-    icon = weather.get("icon") or ""
+    icon = icon_url(weather.get("icon") or "")
     city = item.get("city_name") or "Неизвестно"
+    try:
+        code = int(weather.get("code") or 0)
+    except (TypeError, ValueError):
+        code = 0
+
+    return {"city": city, "temp": temp, "descr": descr, "icon": icon, "code": code}
+
+
+class UpstreamRequestError(RuntimeError):
+    """API отклонил сам запрос (4xx, кроме 429): ошибка запроса, а не признак неисправности upstream."""
+
+
+def _rejected(status: int) -> UpstreamRequestError:
+    logger.error("API отклонил запрос: HTTP %s", status)
+    return UpstreamRequestError(f"API отклонил запрос: HTTP {status}")
+
+
+def _rate_limited(retry_after: Optional[str]) -> QuotaExceededError:
+    """Ответ 429: остановить запросы на Retry-After; ошибка — отказ по квоте, а не сбой upstream."""
+    seconds = parse_retry_after(retry_after)
+    if seconds is None:
+        seconds = 60.0   # заголовка нет или он некорректен; "Retry-After: 0" — повтор сразу
+    _quota.block(seconds)
+    return QuotaExceededError(f"API ограничил частоту запросов, повтор через {seconds:.0f} с")
+
+
+async def _get_with_retries(params: dict, background: bool = False):
+    """
+    GET к API с повторами и экспоненциальной задержкой через asyncio.sleep
+    (аналог повторов синхронной сессии, но без блокировки event loop). Возвращает распарсенный JSON.
+    Каждый повтор берёт токен квоты (фоновый запрос — без резерва пользовательских);
+    429 не повторяется: запросы останавливаются на Retry-After, бросается QuotaExceededError.
+    """
+    client = _get_async_client()
+    attempt = 0
+    while True:
+        try:
+            resp = await client.get(url, params=params)
+        except httpx.TransportError:
+            if attempt >= _RETRY_TOTAL:
+                raise
+            upstream_retries.inc(1, "transport")
+        else:
+            if resp.status_code == 429:
+                raise _rate_limited(resp.headers.get("retry-after"))
+            if 400 <= resp.status_code < 500:
+                raise _rejected(resp.status_code)
+            if resp.status_code not in _RETRY_STATUSES or attempt >= _RETRY_TOTAL:
+                resp.raise_for_status()
+                return resp.json()
+            upstream_retries.inc(1, str(resp.status_code))
+        await asyncio.sleep(_RETRY_BACKOFF * (2 ** attempt))
+        # повтор — тоже запрос к API: без свободного токена повторов больше нет
+        if not _quota.try_acquire(background):
+            raise QuotaExceededError("Квота API не позволяет повторить запрос")
+        attempt += 1
+
+
+def _get_sync_with_retries(params: dict):
+    """
+    То же, что _get_with_retries, для синхронного data_url (requests, паузы через time.sleep):
+    повторы при сетевых ошибках и 5xx, каждый повтор берёт токен квоты; 429 и другие 4xx не повторяются.
+    """
+    from requests.exceptions import ConnectionError, Timeout
+
+    session = _get_session()
+    attempt = 0
+    while True:
+        try:
+            resp = session.get(url, params=params, timeout=UPSTREAM_TIMEOUT)
+        except (ConnectionError, Timeout):
+            if attempt >= _RETRY_TOTAL:
+                raise
+            upstream_retries.inc(1, "transport")
+        else:
+            if resp.status_code == 429:
+                raise _rate_limited(resp.headers.get("Retry-After"))
+            if 400 <= resp.status_code < 500:
+                raise _rejected(resp.status_code)
+            if resp.status_code not in _RETRY_STATUSES or attempt >= _RETRY_TOTAL:
+                resp.raise_for_status()
+                return resp.json()
+            upstream_retries.inc(1, str(resp.status_code))
+        time.sleep(_RETRY_BACKOFF * (2 ** attempt))
+        if not _quota.try_acquire():
+            raise QuotaExceededError("Квота API не позволяет повторить запрос")
+        attempt += 1
+
+
+async def _request_upstream(lat: float, lon: float, background: bool = False) -> dict:
+    """Один запрос к API (с повторами и дедлайном) -> распарсенный словарь погоды."""
+    started = time.perf_counter()
+    outcome = "error"
+    upstream_inflight.inc()
+    try:
+        payload = await asyncio.wait_for(_get_with_retries(_params(lat, lon), background), UPSTREAM_DEADLINE)
+        outcome = "ok"
+    except QuotaExceededError as exc:
+        outcome = "rate_limited"
+        logger.warning("%s", exc)
+        raise
+    except UpstreamRequestError:
+        outcome = "rejected"
+        raise
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        logger.error("Превышен дедлайн запроса к API (%s с)", UPSTREAM_DEADLINE)
+        raise RuntimeError(f"Ошибка сети: превышено время ожидания ({UPSTREAM_DEADLINE} с)")
+    except httpx.HTTPError as exc:
+        logger.error("Сетевая ошибка: %s", exc)
+        raise RuntimeError(f"Ошибка сети: {exc}")
+    except ValueError as exc:
+        logger.error("Невалидный JSON: %s", exc)
+        raise RuntimeError(f"Невалидный JSON: {exc}")
+    finally:
+        upstream_inflight.dec()
+        upstream_latency.observe(time.perf_counter() - started, outcome)
+    return _parse_payload(payload)
+
+
+async def _fetch_and_store(cache_key: str, lat: float, lon: float, background: bool = False) -> dict:
+    """Запрос к API через квоту и выключатель и запись результата в кэш."""
+    # квота проверяется до выключателя: отказ по квоте — не ошибка upstream
+    await _quota.acquire(background)
+    if not _breaker.allow():
+        _quota.refund()
+        raise CircuitOpenError("Сервис погоды временно недоступен")
+    try:
+        data = await _request_upstream(lat, lon, background)
+    except (QuotaExceededError, UpstreamRequestError):
+        # 429 / нет токена на повтор: API просит подождать, это не отказ upstream —
+        # пауза Retry-After не должна размыкать выключатель на open_for секунд.
+        # Остальные 4xx — ошибка самого запроса: один клиент не должен размыкать выключатель для всех.
+        # Сбоями считаются только сетевые ошибки, таймауты и 5xx
+        _breaker.release()
+        raise
+    except BaseException:
+        # в том числе отмена: иначе пробный запрос half_open так и остался бы "в полёте"
+        _breaker.record_failure()
+        raise
+    _breaker.record_success()
+    return _store(cache_key, data)
+
+
+def _stale_fallback(cache_key: str) -> Optional[dict]:
+    """Последние известные данные ключа (любого возраста) с пометкой stale и возрастом в секундах."""
+    entry = _cache.get_entry(cache_key)
+    if entry is None:
+        return None
+    data, age = entry
+    result = dict(data)
+    result.update(stale=True, age=round(age))
+    return result
+
+
+async def _shared_lookup(cache_key: str, max_age: float) -> Optional[dict]:
+    """
+    Данные из общего L2-кэша, если они моложе max_age (заодно кладутся в L1).
+    Если они новее записи L1 (их получил другой воркер), подписчики узнают о них так же,
+    как о собственном ответе API — иначе рассылка и сводки этого воркера не обновятся.
+    """
+    hit = await asyncio.to_thread(_shared.get, cache_key)
+    if hit is None:
+        return None
+    data, ts = hit
+    if time.time() - ts >= max_age:
+        return None
+    entry = _cache.get_entry(cache_key)
+    if entry is not None and entry[0].ts >= ts:
+        return entry[0]
+    data = Reading(data, ts)
+    _cache.set(cache_key, data, stored_at=ts)
+    _notify(cache_key, data, from_shared=True)
+    return data
+
+
+async def _load_or_fetch(cache_key: str, lat: float, lon: float, max_age: float, background: bool = False) -> dict:
+    """
+    Промах L1: без общего кэша — сразу запрос к API.
+    С общим кэшем — сначала L2; если там нет свежих данных, к API идёт только
+    воркер, захвативший блокировку района, остальные ждут его результат в L2.
+    """
+    if _shared is None:
+        return await _fetch_and_store(cache_key, lat, lon, background)
+
+    # Ошибки SQLite (например, "database is locked" при конкуренции воркеров) не доходят до клиента:
+    # без L2 район запрашивается у API напрямую
+    try:
+        data = await _shared_lookup(cache_key, max_age)
+        if data is not None:
+            return data
+        locked = await asyncio.to_thread(_shared.try_lock, cache_key, _owner, UPSTREAM_DEADLINE + 5)
+    except sqlite3.Error as exc:
+        logger.error("Общий кэш недоступен (%s), запрашиваем API напрямую", exc)
+        return await _fetch_and_store(cache_key, lat, lon, background)
+
+    if locked:
+        try:
+            data = await _fetch_and_store(cache_key, lat, lon, background)
+            try:
+                await asyncio.to_thread(_shared.save, cache_key, data, data.ts)
+            except sqlite3.Error as exc:
+                logger.error("Не удалось записать %s в общий кэш: %s", cache_key, exc)
+            return data
+        finally:
+            try:
+                await asyncio.to_thread(_shared.unlock, cache_key, _owner)
+            except sqlite3.Error as exc:
+                # блокировка снимется сама по истечении аренды
+                logger.error("Не удалось снять блокировку %s в общем кэше: %s", cache_key, exc)
+
+    # район обновляет другой воркер — ждём его результат
+    deadline = time.monotonic() + SHARED_LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        try:
+            data = await _shared_lookup(cache_key, max_age)
+        except sqlite3.Error as exc:
+            logger.error("Общий кэш недоступен (%s), запрашиваем API напрямую", exc)
+            break
+        if data is not None:
+            return data
+    return await _fetch_and_store(cache_key, lat, lon, background)
+
+
+async def _revalidate(cache_key: str, lat: float, lon: float) -> None:
+    try:
+        await _flights.do(cache_key, lambda: _load_or_fetch(cache_key, lat, lon, _fresh_ttl(), background=True))
+    except RuntimeError:
+        pass  # уже залогировано в _fetch_and_store, клиент получил устаревшие данные
+
+
+async def _reading_async(region_id: str) -> dict:
+    """Запись кэша (Reading, не копия — не изменять) или словарь stale-данных; логика data_url_async."""
+    cache_key, (lat, lon) = resolve_region(region_id)
+    fresh_ttl = _fresh_ttl()
+    cached = _cache.get(cache_key, ttl=fresh_ttl)
+    if cached is not None:
+        return cached
+
+    entry = _cache.get_entry(cache_key)
+    if entry is not None and entry[1] < max(STALE_TTL, fresh_ttl):
+        task = asyncio.ensure_future(_revalidate(cache_key, lat, lon))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        _stale_served.inc(1, "revalidate")
+        return entry[0]
+
+    try:
+        return await _flights.do(cache_key, lambda: _load_or_fetch(cache_key, lat, lon, fresh_ttl))
+    except RuntimeError:
+        fallback = _stale_fallback(cache_key)
+        if fallback is None:
+            raise
+        _stale_served.inc(1, "fallback")
+        return fallback
+
+
+async def data_url_async(region_id: str) -> dict:
+    """
+    Асинхронный вариант data_url: тот же вход, тот же словарь и те же исключения.
+    Весь запрос (включая повторы) ограничен дедлайном UPSTREAM_DEADLINE.
+    Одновременные запросы одного ключа объединяются в один запрос к API.
+    Просроченная, но не старше STALE_TTL запись отдаётся сразу и обновляется в фоне.
+    Если API недоступен (ошибка или разомкнут выключатель), отдаются последние известные
+    данные района с полями "stale": True и "age" (секунды); RuntimeError — только если их нет.
+    """
+    return dict(await _reading_async(region_id))
+
+
+async def data_json_async(region_id: str) -> Tuple[bytes, str]:
+    """
+    То же, что data_url_async, но готовым JSON: (тело, ETag). Для записи из кэша
+    тело и ETag уже посчитаны; кодируются заново только stale-данные (в них меняется age).
+    """
+    data = await _reading_async(region_id)
+    if isinstance(data, Reading):
+        return data.body, data.etag
+    body = encode_json(data)
+    return body, make_etag(body)
+
+
+async def refresh_region(region_id: str, max_age: float = 0.0) -> dict:
+    """
+    Принудительно обновить запись из API (для фонового обновления), минуя свежесть кэша.
+    С общим кэшем данные, которые другой воркер получил менее max_age секунд назад, берутся из L2.
+    Запрос фоновый: при нехватке квоты API он отклоняется раньше пользовательских.
+    """
+    cache_key, (lat, lon) = resolve_region(region_id)
+    return dict(await _flights.do(cache_key, lambda: _load_or_fetch(cache_key, lat, lon, max_age, background=True)))
+
+
+def cached_reading(region_id: str) -> Optional[dict]:
+    """Последние данные из кэша для region_id любого возраста (без запроса к API) или None."""
+    entry = _cache.get_entry(resolve_region(region_id)[0])
+    return None if entry is None else dict(entry[0])
+
+
+def region_age(region_id: str) -> Optional[float]:
+    """Возраст данных в кэше для region_id в секундах или None, если данных нет."""
+    entry = _cache.get_entry(resolve_region(region_id)[0])
+    return None if entry is None else entry[1]
+
+
+async def data_many_async(region_ids, concurrency: Optional[int] = None) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """
+    Погода сразу для нескольких region_id (ключи coord или "lat:lon").
+    Запросы идут параллельно, не более concurrency (по умолчанию BATCH_CONCURRENCY) одновременно.
+    Ошибка одного района не прерывает остальные: возвращает (результаты, ошибки) по region_id.
+    """
+    return await _many(region_ids, data_url_async, concurrency)
+
+
+async def data_many_json_async(region_ids, concurrency: Optional[int] = None) -> Tuple[Dict[str, bytes], Dict[str, str]]:
+    """Как data_many_async, но результаты — готовые JSON-фрагменты районов (из кэша, без повторного кодирования)."""
+
+    async def body(region_id: str) -> bytes:
+        return (await data_json_async(region_id))[0]
+
+    return await _many(region_ids, body, concurrency)
+
+
+async def _many(region_ids, get: Callable[[str], Awaitable], concurrency: Optional[int]) -> Tuple[dict, Dict[str, str]]:
+    sem = asyncio.Semaphore(concurrency or BATCH_CONCURRENCY)
+    results: dict = {}
+    errors: Dict[str, str] = {}
+
+    async def one(region_id: str) -> None:
+        async with sem:
+            try:
+                results[region_id] = await get(region_id)
+            except (ValueError, RuntimeError) as exc:
+                errors[region_id] = str(exc)
+
+    # dict.fromkeys убирает повторы, сохраняя порядок
+    unique = list(dict.fromkeys(region_ids))
+    await asyncio.gather(*(one(r) for r in unique))
+    # результаты в порядке запроса, а не в порядке завершения
+    return {r: results[r] for r in unique if r in results}, errors
+
+
+def data_url(region_id: str) -> dict:
+    """
+    Возвращает словарь: {"city": str, "temp": int, "descr": str, "icon": str, "code": int}
+    ("icon" — локальный адрес иконки, например "/icons/c01d.png")
+    Поддерживает:
+      - существующие ключи из coord (например 'gom', 'br' и т.д.)
+      - строку с координатами "lat,lon" (например "52.43,30.98")
+    Бросает ValueError если вход некорректен
+    Бросает RuntimeError при ошибках сети или некорректном ответе API
+    Синхронная обёртка для старых вызовов; в обработчиках FastAPI используйте data_url_async.
+    """
+    cache_key, (lat, lon) = resolve_region(region_id)
+    cached = _cache.get(cache_key, ttl=_fresh_ttl())
+    if cached is not None:
+        return dict(cached)
+
+    if not _quota.try_acquire():
+        fallback = _stale_fallback(cache_key)
+        if fallback is None:
+            raise QuotaExceededError("Квота запросов к API исчерпана")
+        return fallback
+    if not _breaker.allow():
+        _quota.refund()
+        fallback = _stale_fallback(cache_key)
+        if fallback is None:
+            raise CircuitOpenError("Сервис погоды временно недоступен")
+        return fallback
+
+    from requests.exceptions import RequestException
+
+    try:
+        try:
+            payload = _get_sync_with_retries(_params(lat, lon))
+            data = _parse_payload(payload)
+        except RequestException as exc:
+            # Сетевая ошибка или таймаут
+            logger.error("Сетевая ошибка: %s", exc)
+            raise RuntimeError(f"Ошибка сети: {exc}")
+        except ValueError as exc:
+            logger.error("Невалидный JSON: %s", exc)
+            raise RuntimeError(f"Невалидный JSON: {exc}")
+    except RuntimeError as exc:
+        # как и в data_url_async: при ошибке API — последние известные данные района, если они есть
+        if isinstance(exc, (QuotaExceededError, UpstreamRequestError)):
+            _breaker.release()   # 429 и другие 4xx — не сбой upstream
+        else:
+            _breaker.record_failure()
+        fallback = _stale_fallback(cache_key)
+        if fallback is None:
+            raise
+        _stale_served.inc(1, "fallback")
+        return fallback
 
-    return {"city": city, "temp": temp, "descr": descr, "icon": icon}
\ No newline at end of file
+    _breaker.record_success()
+    _store(cache_key, data)
+    return dict(data)
@@ -0,0 +1,319 @@
+# assets.py
+# Отдача статических файлов (/static, /imgs) из памяти с предсжатыми вариантами gzip / brotli
+# Запуск: используется импортом из main.py
+
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+import time
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+from httpcache import http_date, is_not_modified
+from metrics import static_bytes
+
+try:
+    import brotli  # необязательная зависимость: без неё отдаётся только gzip
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("assets")
+
+ASSET_COMPRESS = os.getenv("ASSET_COMPRESS", "1") not in ("0", "false", "no", "")
+ASSET_CHECK_INTERVAL = float(os.getenv("ASSET_CHECK_INTERVAL", "1"))   # как часто проверять mtime файлов, сек
+ASSET_MAX_MEMORY_SIZE = int(os.getenv("ASSET_MAX_MEMORY_SIZE", str(2 * 1024 * 1024)))  # больше — отдаётся с диска
+MIN_COMPRESS_SIZE = 512
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Типы, которые имеет смысл сжимать (png/jpg уже сжаты)
+COMPRESSIBLE = {
+    "text/css", "text/html", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "image/svg+xml",
+}
+
+
+class Asset:
+    """
+    Запись индекса: размер, mtime, MIME, ETag и хэш-версия для URL.
+    Содержимое файлов до ASSET_MAX_MEMORY_SIZE хранится в памяти (body), большие
+    отдаются с диска (body = None). Сжатые варианты строятся лениво.
+    """
+
+    __slots__ = ("path", "body", "mtime", "size", "mime", "version", "etag", "_variants")
+
+    def __init__(self, path: str):
+        st = os.stat(path)
+        digest = hashlib.blake2b(digest_size=12)
+        body = None
+        with open(path, "rb") as f:
+            if st.st_size <= ASSET_MAX_MEMORY_SIZE:
+                body = f.read()
+                digest.update(body)
+            else:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        self.path = path
+        self.body = body
+        self.mtime = st.st_mtime
+        self.size = st.st_size
+        self.mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.version = digest.hexdigest()[:10]
+        self.etag = f'"{digest.hexdigest()}"'
+        self._variants: Dict[str, Optional[bytes]] = {}
+
+    def variant(self, encoding: str) -> Optional[bytes]:
+        """Сжатое содержимое ("gzip" / "br") или None, если сжатие не нужно или не даёт выигрыша."""
+        if encoding not in self._variants:
+            data = None
+            if (ASSET_COMPRESS and self.body is not None and self.mime in COMPRESSIBLE
+                    and self.size >= MIN_COMPRESS_SIZE):
+                if encoding == "gzip":
+                    data = gzip.compress(self.body, compresslevel=9, mtime=0)
+                elif encoding == "br" and brotli is not None:
+                    data = brotli.compress(self.body, quality=11)
+                if data is not None and len(data) >= self.size:
+                    data = None
+            self._variants[encoding] = data
+        return self._variants[encoding]
+
+
+def _count_bytes(request: Request, size: int, encoding: str) -> None:
+    """static_bytes: на HEAD тело не отправляется — не считаем."""
+    if request.method != "HEAD":
+        static_bytes.inc(size, encoding)
+
+
+def _file_bytes(request: Request, asset: Asset, last_modified: str) -> int:
+    """
+    Сколько байт отдаст FileResponse: файл целиком без Range (или при несовпавшем If-Range),
+    длина диапазона для одного диапазона; несколько диапазонов и ошибочный Range не считаются.
+    """
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if not range_header or (if_range is not None and if_range not in (asset.etag, last_modified)):
+        return asset.size
+    try:
+        byte_range = _parse_range(range_header, asset.size)
+    except ValueError:
+        return 0
+    if byte_range is None:
+        return 0
+    return byte_range[1] + 1 - byte_range[0]
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон "bytes=a-b" / "bytes=a-" / "bytes=-n" -> (start, end) включительно.
+    None — заголовок не поддерживается (несколько диапазонов и т.п.), отдаём файл целиком;
+    ValueError — диапазон вне файла (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                raise ValueError(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Разбор Accept-Encoding: {"gzip": 1.0, "br": 0.5, ...}."""
+    result = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[token.strip().lower()] = q
+    return result
+
+
+class AssetStore:
+    """
+    Индекс файлов одного каталога, отдаваемых по url_prefix.
+    После scan() индекс полный: поиск файла — обращение к словарю без проверок ФС,
+    а изменения каталога (новые/удалённые/изменённые файлы) подхватываются проверкой
+    mtime каталогов и файлов не чаще check_interval. До scan() файлы читаются по первому запросу.
+    url() даёт адрес с хэшем содержимого (?v=...): такой адрес кэшируется клиентом
+    навсегда (immutable), а при изменении файла меняется.
+    """
+
+    def __init__(self, directory: str, url_prefix: str, check_interval: float = ASSET_CHECK_INTERVAL):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip("/")
+        self.check_interval = check_interval
+        self._root = os.path.realpath(directory)
+        self._assets: Dict[str, Asset] = {}
+        self._dirs: Dict[str, float] = {}    # каталог -> mtime при последнем сканировании
+        self._indexed = False
+        self._checked_at = 0.0
+        self._generation = 0
+
+    def _full_path(self, relpath: str) -> str:
+        full = os.path.realpath(os.path.join(self._root, relpath))
+        if not full.startswith(self._root + os.sep):
+            raise FileNotFoundError(relpath)
+        return full
+
+    def get(self, relpath: str) -> Asset:
+        """Файл по пути относительно каталога; FileNotFoundError, если его нет."""
+        self._check_changes()
+        asset = self._assets.get(relpath)
+        if asset is None:
+            if self._indexed:
+                raise FileNotFoundError(relpath)
+            full = self._full_path(relpath)
+            if not os.path.isfile(full):
+                raise FileNotFoundError(relpath)
+            asset = Asset(full)
+            self._assets[relpath] = asset
+        return asset
+
+    def __contains__(self, relpath: str) -> bool:
+        try:
+            self.get(relpath)
+            return True
+        except OSError:
+            return False
+
+    def scan(self) -> None:
+        """Построить полный индекс каталога (уже загруженные неизменённые файлы переиспользуются)."""
+        assets: Dict[str, Asset] = {}
+        dirs: Dict[str, float] = {}
+        for dirpath, _, filenames in os.walk(self._root):
+            dirs[dirpath] = os.stat(dirpath).st_mtime
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                relpath = os.path.relpath(full, self._root).replace(os.sep, "/")
+                old = self._assets.get(relpath)
+                try:
+                    st = os.stat(full)
+                    if old is not None and old.mtime == st.st_mtime and old.size == st.st_size:
+                        assets[relpath] = old
+                    else:
+                        assets[relpath] = Asset(full)
+                except OSError as exc:
+                    logger.warning("Не удалось загрузить %s: %s", full, exc)
+        self._assets = assets
+        self._dirs = dirs
+        self._indexed = True
+        self._checked_at = time.monotonic()
+        self._generation += 1
+        logger.info("Индекс %s: %d файлов, %d байт", self.directory, len(assets), sum(a.size for a in assets.values()))
+
+    def _check_changes(self) -> None:
+        """Не чаще check_interval: перечитать изменившиеся файлы, при изменении каталога — пересканировать."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._indexed:
+            for dirpath, mtime in self._dirs.items():
+                try:
+                    changed = os.stat(dirpath).st_mtime != mtime
+                except OSError:
+                    changed = True
+                if changed:
+                    self.scan()
+                    return
+        for relpath, asset in list(self._assets.items()):
+            try:
+                st = os.stat(asset.path)
+            except OSError:
+                del self._assets[relpath]
+                self._generation += 1
+                continue
+            if st.st_mtime != asset.mtime or st.st_size != asset.size:
+                self._assets[relpath] = Asset(asset.path)
+                self._generation += 1
+                logger.info("Файл изменён: %s", asset.path)
+
+    def generation(self) -> int:
+        """Счётчик изменений файлов (для перерендера страниц с хэш-адресами)."""
+        self._check_changes()
+        return self._generation
+
+    def url(self, relpath: str) -> str:
+        """Адрес файла с версией по содержимому; без версии, если файла нет."""
+        relpath = relpath.lstrip("/")
+        try:
+            return f"{self.url_prefix}/{relpath}?v={self.get(relpath).version}"
+        except OSError:
+            return f"{self.url_prefix}/{relpath}"
+
+    def response(self, request: Request, relpath: str) -> Response:
+        """
+        Ответ с файлом: выбор gzip/br по Accept-Encoding, ETag, 304, Range (206/416),
+        immutable для ?v=<хэш>.
+        """
+        asset = self.get(relpath)
+        cache_control = IMMUTABLE if request.query_params.get("v") == asset.version else "no-cache"
+        headers = {
+            "Last-Modified": http_date(asset.mtime),
+            "Cache-Control": cache_control,
+            "Accept-Ranges": "bytes",
+        }
+        if asset.mime in COMPRESSIBLE:
+            headers["Vary"] = "Accept-Encoding"
+
+        if asset.body is None:
+            # большой файл: отдаём с диска потоком (FileResponse сам обрабатывает Range)
+            headers["ETag"] = asset.etag
+            if is_not_modified(request, asset.etag, asset.mtime):
+                return Response(status_code=304, headers=headers)
+            _count_bytes(request, _file_bytes(request, asset, headers["Last-Modified"]), "identity")
+            return FileResponse(asset.path, media_type=asset.mime, headers=headers)
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (if_range is None or if_range == asset.etag):
+            headers["ETag"] = asset.etag
+            try:
+                byte_range = _parse_range(range_header, asset.size)
+            except ValueError:
+                headers["Content-Range"] = f"bytes */{asset.size}"
+                return Response(status_code=416, headers=headers)
+            if byte_range is not None:
+                start, end = byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{asset.size}"
+                _count_bytes(request, end + 1 - start, "identity")
+                return Response(asset.body[start:end + 1], status_code=206, media_type=asset.mime, headers=headers)
+
+        body, encoding = asset.body, None
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        for candidate in ("br", "gzip"):
+            if accepted.get(candidate, 0) > 0:
+                compressed = asset.variant(candidate)
+                if compressed is not None:
+                    body, encoding = compressed, candidate
+                    break
+
+        # у каждого представления свой сильный ETag
+        headers["ETag"] = asset.etag if encoding is None else f'{asset.etag[:-1]}-{encoding}"'
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if is_not_modified(request, headers["ETag"], asset.mtime):
+            return Response(status_code=304, headers=headers)
+        _count_bytes(request, len(body), encoding or "identity")
+        return Response(body, media_type=asset.mime, headers=headers)
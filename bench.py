@@ -0,0 +1,270 @@
+# bench.py
+# Нагрузочный тест приложения без сети: локальная заглушка Weatherbit + конкурентные клиенты
+# Запуск: python bench.py [--requests 2000] [--concurrency 50] [--latency 0.05] [--error-rate 0.05]
+#                         [--burst-every 10 --burst-length 2] [--out bench.json] [--compare old.json]
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+ROUTES = ("weather", "batch", "oblast_json", "oblast_page", "static")
+
+
+class FakeWeatherbit:
+    """
+    Заглушка /v2.0/current: задержка ответа, доля ответов 503 и периодические
+    "всплески" 429 с Retry-After (каждые burst_every секунд на burst_length секунд).
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0,
+                 burst_every: float = 0.0, burst_length: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.statuses: Dict[int, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _in_burst(self) -> bool:
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return False
+        return (time.monotonic() - self._started_at) % self.burst_every < self.burst_length
+
+    def _respond(self, query: dict):
+        """(статус, заголовки, тело) ответа на один запрос."""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+        if self._in_burst():
+            return 429, {"Retry-After": "1"}, b'{"error": "rate limit"}'
+        if failed:
+            return 503, {}, b'{"error": "unavailable"}'
+        lat = float(query.get("lat", ["0"])[0])
+        lon = float(query.get("lon", ["0"])[0])
+        body = {"data": [{
+            "city_name": "Bench",
+            "temp": round((lat * 7 + lon * 3) % 30 - 5, 1),
+            "weather": {"description": "Ясно", "icon": "c01d", "code": 800},
+        }]}
+        return 200, {"Content-Type": "application/json"}, json.dumps(body).encode("utf-8")
+
+    def start(self) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, headers, body = fake._respond(parse_qs(urlparse(self.path).query))
+                with fake._lock:
+                    fake.statuses[status] = fake.statuses.get(status, 0) + 1
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass   # клиент ушёл по дедлайну
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._started_at = time.monotonic()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v2.0/current"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int], wall: float) -> dict:
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": len(values),
+        "seconds": round(wall, 3),
+        "rps": round(len(values) / wall, 1) if wall > 0 else 0.0,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def _path_factories(coord: dict, oblasts: dict, static_url: str, rnd: random.Random) -> Dict[str, Callable[[], str]]:
+    region_ids = list(coord)
+    cities = list(oblasts)
+    return {
+        "weather": lambda: f"/weather/{rnd.choice(region_ids)}",
+        "batch": lambda: "/weather/batch?ids=" + ",".join(rnd.sample(region_ids, 8)),
+        "oblast_json": lambda: f"/weather/oblast/{rnd.choice(cities)}",
+        "oblast_page": lambda: f"/{rnd.choice(cities)}",
+        "static": lambda: static_url,
+    }
+
+
+async def _run_route(client, make_path: Callable[[], str], requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = [requests]
+
+    async def worker() -> None:
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            path = make_path()
+            started = time.perf_counter()
+            resp = await client.get(path, headers={"Accept-Encoding": "gzip, br"})
+            latencies.append(time.perf_counter() - started)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+async def run(args, fake: FakeWeatherbit) -> dict:
+    import httpx
+    import api
+    import main
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        for name in ("httpx", "api", "main", "pages", "assets", "history"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    rnd = random.Random(args.seed)
+    factories = _path_factories(api.coord, api.oblasts, main.static_assets.url("style.css"), rnd)
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            for name in args.routes:
+                make_path = factories[name]
+                await _run_route(client, make_path, args.warmup, min(args.concurrency, max(1, args.warmup)))
+                upstream_before = sum(fake.statuses.values())
+                results[name] = await _run_route(client, make_path, args.requests, args.concurrency)
+                results[name]["upstream_calls"] = sum(fake.statuses.values()) - upstream_before
+                print(_format_row(name, results[name]), flush=True)
+        cache = api.cache_stats()
+        breaker = api.breaker_status()
+    return {"routes": results, "cache": cache, "breaker": breaker}
+
+
+def _format_row(name: str, r: dict) -> str:
+    return (f"{name:<12} {r['requests']:>7} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+            f"{r['p99_ms']:>9.2f} {r['upstream_calls']:>9}  {r['statuses']}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(old: dict, new: dict) -> None:
+    """Изменение пропускной способности и перцентилей относительно предыдущего прогона."""
+    print(f"\nСравнение с {old.get('commit') or '?'} ({old.get('timestamp', '?')}):")
+    for name, r in new["routes"].items():
+        prev = old.get("routes", {}).get(name)
+        if prev is None:
+            continue
+        parts = []
+        for field in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            a, b = prev.get(field) or 0.0, r[field]
+            delta = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            parts.append(f"{field} {a} -> {b} ({delta})")
+        print(f"  {name:<12} " + "; ".join(parts))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест маршрутов приложения на локальной заглушке Weatherbit")
+    parser.add_argument("--routes", default=",".join(ROUTES), help=f"через запятую из: {', '.join(ROUTES)}")
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на маршрут")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных клиентов")
+    parser.add_argument("--warmup", type=int, default=50, help="запросов прогрева на маршрут (не учитываются)")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки, сек")
+    parser.add_argument("--jitter", type=float, default=0.02, help="случайная добавка к задержке, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="период всплесков 429, сек (0 — без них)")
+    parser.add_argument("--burst-length", type=float, default=0.0, help="длительность всплеска 429, сек")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="WEATHER_CACHE_TTL для прогона, сек")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench.json", help="куда сохранить результаты (пустая строка — не сохранять)")
+    parser.add_argument("--compare", default=None, help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--verbose", action="store_true", help="не приглушать логи приложения")
+    args = parser.parse_args(argv)
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in args.routes if r not in ROUTES]
+    if unknown:
+        parser.error(f"неизвестные маршруты: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    fake = FakeWeatherbit(args.latency, args.jitter, args.error_rate, args.burst_every, args.burst_length, args.seed)
+    # Настройки читаются модулями при импорте, поэтому окружение задаётся до import main:
+    # все запросы уходят на заглушку, фоновое обновление и запись на диск выключены
+    os.environ["WEATHERBIT_URL"] = fake.start()
+    os.environ["WEATHER_REFRESH"] = "0"
+    os.environ["WEATHER_STORE_PATH"] = ""
+    os.environ["WEATHER_HISTORY_DIR"] = ""
+    if args.cache_ttl is not None:
+        os.environ["WEATHER_CACHE_TTL"] = str(args.cache_ttl)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"{'route':<12} {'requests':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'upstream':>9}  statuses")
+    try:
+        report = asyncio.run(run(args, fake))
+    finally:
+        fake.stop()
+    report.update(
+        commit=_git_commit(),
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=sys.version.split()[0],
+        config={k: v for k, v in vars(args).items() if k not in ("out", "compare", "verbose")},
+        upstream_statuses={str(k): v for k, v in sorted(fake.statuses.items())},
+    )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
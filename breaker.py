@@ -0,0 +1,112 @@
+# breaker.py
+# Автоматический выключатель (circuit breaker) для запросов к Weatherbit
+# Запуск: используется импортом из api.py
+
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger("breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Выключатель разомкнут: запрос к API не выполняется."""
+
+
+class CircuitBreaker:
+    """
+    Следит за долей ошибок в последних window вызовах.
+    closed    — запросы идут как обычно;
+    open      — после failure_rate ошибок (не менее min_calls вызовов) запросы сразу отклоняются
+                на open_for секунд;
+    half_open — пропускается не более probes пробных запросов: успех замыкает выключатель,
+                ошибка снова размыкает.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        open_for: float = 30.0,
+        probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_for = open_for
+        self.probes = probes
+        self._clock = clock
+        self._results: deque = deque(maxlen=window)   # True — успех, False — ошибка
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_for:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас. В half_open занимает слот пробного запроса."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self._probes_in_flight < self.probes:
+            self._probes_in_flight += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        if self._state == HALF_OPEN:
+            logger.info("Upstream снова доступен, выключатель замкнут")
+            self._state = CLOSED
+            self._results.clear()
+        self._results.append(True)
+
+    def record_failure(self) -> None:
+        if self._state == HALF_OPEN:
+            self._trip()
+            return
+        self._results.append(False)
+        if self._state == CLOSED and len(self._results) >= self.min_calls:
+            failures = self._results.count(False)
+            if failures / len(self._results) >= self.failure_rate:
+                self._trip()
+
+    def release(self) -> None:
+        """
+        Запрос завершился без ответа об исправности upstream (например, 429 — API просит подождать):
+        не успех и не ошибка, но слот пробного запроса half_open освобождается.
+        """
+        if self._state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._probes_in_flight = 0
+        self.trips += 1
+        logger.warning("Выключатель разомкнут на %s с: слишком много ошибок upstream", self.open_for)
+
+    def status(self) -> dict:
+        state = self.state
+        retry_in = max(0.0, self.open_for - (self._clock() - self._opened_at)) if state == OPEN else 0.0
+        return {
+            "state": state,
+            "recent_calls": len(self._results),
+            "recent_failures": self._results.count(False),
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_in": round(retry_in, 1),
+        }
@@ -0,0 +1,117 @@
+# cache.py
+# In-process кэш с временем жизни записей (TTL) и вытеснением по LRU
+# Запуск: используется импортом из api.py
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Кэш "ключ -> значение" с TTL и ограниченным размером.
+    При переполнении вытесняется запись, к которой дольше всего не обращались (LRU).
+    Просроченные записи не удаляются сразу: get() их не отдаёт, а get_entry()
+    позволяет получить последнее известное значение вместе с его возрастом.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 512, clock: Callable[[], float] = time.time):
+        if maxsize <= 0:
+            raise ValueError("maxsize должен быть положительным")
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        # ключ -> (время сохранения, значение)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, ttl: Optional[float] = None) -> Optional[Any]:
+        """Свежее значение или None. Учитывается в счётчиках попаданий/промахов."""
+        entry = self._data.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if self._clock() - stored_at < (self.ttl if ttl is None else ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def get_entry(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """(значение, возраст в секундах) независимо от TTL, либо None. Счётчики не меняются."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        return value, max(0.0, self._clock() - stored_at)
+
+    def set(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        self._data[key] = (self._clock() if stored_at is None else stored_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.pop(key, None)
+        return None if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Объединение одновременных запросов по ключу (single-flight).
+    Первый вызов запускает корутину отдельной задачей, остальные ждут ту же задачу
+    и получают тот же результат или то же исключение. Задача не привязана к
+    вызывающему, поэтому отмена "ведущего" запроса не ломает остальных.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.started = 0
+        self.joined = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            self.started += 1
+        else:
+            self.joined += 1
+        # shield: отмена одного ожидающего не отменяет общую задачу
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: "asyncio.Task") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # помечаем исключение как полученное, даже если все ожидающие уже отменены
+            task.exception()
@@ -0,0 +1,85 @@
+# events.py
+# Рассылка изменений погоды подписчикам (SSE / WebSocket) из одного серверного обновления
+# Запуск: используется импортом из main.py (подписан на обновления через api.add_listener)
+
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger("events")
+
+# Сколько непрочитанных событий держать для медленного клиента (старые отбрасываются)
+SUBSCRIBER_QUEUE_SIZE = 64
+
+
+class Broadcaster:
+    """
+    Подписчики на ключи районов получают событие только когда данные района изменились.
+    publish() подходит как подписчик api.add_listener: fn(ключ, данные, время).
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs: Dict[str, Set[asyncio.Queue]] = {}
+        self._last: Dict[str, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, key: str, data: dict, ts: float = 0.0) -> None:
+        if self._last.get(key) == data:
+            return
+        self._last[key] = data
+        if not self._subs.get(key):
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(key, data)
+        elif self._loop is not None and not self._loop.is_closed():
+            # вызов из другого потока (например, синхронный data_url)
+            self._loop.call_soon_threadsafe(self._deliver, key, data)
+
+    def _deliver(self, key: str, data: dict) -> None:
+        for queue in list(self._subs.get(key, ())):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait((key, data))
+            self.published += 1
+
+    @contextmanager
+    def subscribe(self, keys: Iterable[str]):
+        """Очередь событий (ключ, данные) по ключам keys; отписка при выходе из with."""
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        keys = list(dict.fromkeys(keys))
+        for key in keys:
+            self._subs.setdefault(key, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            for key in keys:
+                subs = self._subs.get(key)
+                if subs is not None:
+                    subs.discard(queue)
+                    if not subs:
+                        del self._subs[key]
+
+    async def next_event(self, queue: asyncio.Queue, timeout: float) -> Optional[Tuple[str, dict]]:
+        """Следующее событие или None, если за timeout ничего не пришло."""
+        try:
+            return await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len({id(q) for subs in self._subs.values() for q in subs}),
+            "keys": len(self._subs),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,110 @@
+# export.py
+# Потоковая выгрузка показаний всех районов в NDJSON / CSV (строка уходит клиенту, как только готова)
+# Запуск: используется импортом из main.py (/weather/export)
+
+import io
+import csv
+import json
+import time
+import zlib
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+# Колонки CSV; строки NDJSON — те же поля (пустые опускаются)
+COLUMNS = ("kind", "region_id", "oblast", "ts", "temp", "descr", "icon", "code", "stale", "error")
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+async def export_rows(
+    region_ids: Iterable[str],
+    fetch: Callable[[str], Awaitable[dict]],
+    oblast_of: Dict[str, str],
+    age_of: Callable[[str], Optional[float]],
+    history: Optional[Callable[[str], List[dict]]] = None,
+    concurrency: int = 8,
+) -> AsyncIterator[List[dict]]:
+    """
+    Группы строк по районам в порядке готовности: текущее показание (kind="current"),
+    за ним, если задан history, показания из истории (kind="history").
+    Не более concurrency запросов одновременно; ошибка района — строка с полем error.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(region_id: str) -> List[dict]:
+        async with semaphore:
+            try:
+                data = await fetch(region_id)
+            except (ValueError, RuntimeError) as exc:
+                return [{"kind": "current", "region_id": region_id, "oblast": oblast_of.get(region_id),
+                         "error": str(exc)}]
+        age = age_of(region_id)
+        rows = [{
+            "kind": "current",
+            "region_id": region_id,
+            "oblast": oblast_of.get(region_id),
+            "ts": int(time.time() - age) if age is not None else None,
+            "temp": data.get("temp"),
+            "descr": data.get("descr"),
+            "icon": data.get("icon"),
+            "code": data.get("code"),
+            "stale": data.get("stale") or None,
+        }]
+        if history is not None:
+            rows.extend({"kind": "history", "region_id": region_id, "oblast": oblast_of.get(region_id), **item}
+                        for item in history(region_id))
+        return rows
+
+    tasks = [asyncio.ensure_future(one(region_id)) for region_id in dict.fromkeys(region_ids)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # клиент отключился — незавершённые запросы больше не нужны
+        for task in tasks:
+            task.cancel()
+
+
+def encode_ndjson(rows: List[dict]) -> bytes:
+    return "".join(
+        json.dumps({k: v for k, v in row.items() if v is not None}, ensure_ascii=False) + "\n" for row in rows
+    ).encode("utf-8")
+
+
+class _CsvEncoder:
+    """Строки CSV через один переиспользуемый буфер."""
+
+    def __init__(self):
+        self._buf = io.StringIO()
+        self._writer = csv.DictWriter(self._buf, fieldnames=COLUMNS, extrasaction="ignore", lineterminator="\n")
+
+    def _take(self) -> bytes:
+        chunk = self._buf.getvalue()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return chunk.encode("utf-8")
+
+    def header(self) -> bytes:
+        self._writer.writeheader()
+        return self._take()
+
+    def __call__(self, rows: List[dict]) -> bytes:
+        self._writer.writerows(rows)
+        return self._take()
+
+
+async def encode(groups: AsyncIterator[List[dict]], fmt: str, compress: bool) -> AsyncIterator[bytes]:
+    """Фрагменты ответа по районам; с gzip каждый фрагмент дожимается Z_SYNC_FLUSH, чтобы клиент получил его сразу."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None   # wbits=31 — формат gzip
+
+    def out(data: bytes) -> bytes:
+        return gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH) if gz is not None else data
+
+    if fmt == "csv":
+        encoder = _CsvEncoder()
+        yield out(encoder.header())
+    else:
+        encoder = encode_ndjson
+    async for rows in groups:
+        yield out(encoder(rows))
+    if gz is not None:
+        yield gz.flush()
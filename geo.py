@@ -0,0 +1,72 @@
+# geo.py
+# Поиск ближайшего района по произвольным координатам (k-d дерево)
+# Запуск: используется импортом из api.py
+
+import math
+from typing import Dict, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _to_xyz(lat: float, lon: float) -> Tuple[float, float, float]:
+    """Точка на единичной сфере: хордовое расстояние монотонно с расстоянием по поверхности."""
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+def _chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу (гаверсинус), км."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class KDTree:
+    """
+    k-d дерево по точкам {ключ: (lat, lon)} в трёхмерных координатах на сфере.
+    nearest() — O(log n) в среднем вместо перебора всех районов.
+    """
+
+    def __init__(self, points: Dict[str, Tuple[float, float]]):
+        items = [(_to_xyz(lat, lon), key) for key, (lat, lon) in points.items()]
+        self._root = self._build(items, 0)
+        self.size = len(items)
+
+    def _build(self, items, depth: int):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda it: it[0][axis])
+        mid = len(items) // 2
+        xyz, key = items[mid]
+        # узел: (ось, точка, ключ, левое поддерево, правое поддерево)
+        return (axis, xyz, key, self._build(items[:mid], depth + 1), self._build(items[mid + 1:], depth + 1))
+
+    def nearest(self, lat: float, lon: float) -> Optional[Tuple[str, float]]:
+        """(ключ ближайшей точки, расстояние в км) или None для пустого дерева."""
+        if self._root is None:
+            return None
+        target = _to_xyz(lat, lon)
+        best = [None, float("inf")]   # ключ, квадрат хордового расстояния
+
+        def visit(node) -> None:
+            if node is None:
+                return
+            axis, xyz, key, left, right = node
+            d2 = (xyz[0] - target[0]) ** 2 + (xyz[1] - target[1]) ** 2 + (xyz[2] - target[2]) ** 2
+            if d2 < best[1]:
+                best[0], best[1] = key, d2
+            diff = target[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            # дальнюю ветку смотрим, только если разделяющая плоскость ближе лучшего найденного
+            if diff * diff < best[1]:
+                visit(far)
+
+        visit(self._root)
+        return best[0], _chord_to_km(math.sqrt(best[1]))
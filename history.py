@@ -0,0 +1,267 @@
+# history.py
+# История показаний по районам: кольцевые буферы в колонках array + файлы только на дозапись
+# Запуск: создаётся в main.py, подписан на обновления через api.add_listener
+
+import os
+import asyncio
+import logging
+import struct
+from array import array
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from lazy import optional
+
+logger = logging.getLogger("history")
+
+HISTORY_SIZE = int(os.getenv("WEATHER_HISTORY_SIZE", "4096"))                  # показаний на район в памяти
+HISTORY_DIR = os.getenv("WEATHER_HISTORY_DIR", "history")                     # пустая строка — только память
+HISTORY_FLUSH_INTERVAL = float(os.getenv("WEATHER_HISTORY_FLUSH_INTERVAL", "60"))
+
+# Запись в файле: время (uint32), температура (int16), код погоды (uint16), иконка (4 байта ASCII) — 12 байт
+_RECORD = struct.Struct("<IhH4s")
+STEPS = {"hour": 3600, "day": 86400}
+
+
+class _Icons:
+    """Таблица иконок: в буфере хранится 1 байт индекса вместо строки."""
+
+    def __init__(self):
+        self.names: List[str] = [""]
+        self._index: Dict[str, int] = {"": 0}
+
+    def index(self, name: str) -> int:
+        idx = self._index.get(name)
+        if idx is None:
+            if len(self.names) > 255:
+                return 0
+            idx = len(self.names)
+            self.names.append(name)
+            self._index[name] = idx
+        return idx
+
+
+class RingSeries:
+    """
+    Кольцевой буфер показаний одного района: по колонке array на поле,
+    9 байт на показание (время 4, температура 2, код 2, иконка 1).
+    """
+
+    __slots__ = ("capacity", "ts", "temp", "code", "icon", "head", "count")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = array("I", bytes(4 * capacity))
+        self.temp = array("h", bytes(2 * capacity))
+        self.code = array("H", bytes(2 * capacity))
+        self.icon = array("B", bytes(capacity))
+        self.head = 0     # куда писать следующее показание
+        self.count = 0
+
+    def append(self, ts: int, temp: int, code: int, icon: int) -> None:
+        i = self.head
+        self.ts[i], self.temp[i], self.code[i], self.icon[i] = ts, temp, code, icon
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _ordered(self, column: array) -> array:
+        """Колонка в хронологическом порядке (старые -> новые)."""
+        if self.count < self.capacity:
+            return column[:self.count]
+        return column[self.head:] + column[:self.head]
+
+    def last_ts(self) -> int:
+        return self.ts[(self.head - 1) % self.capacity] if self.count else 0
+
+    def select(self, t_from: int, t_to: int) -> Tuple[array, array, array, array]:
+        """Колонки (ts, temp, code, icon) показаний с t_from <= ts <= t_to."""
+        ts = self._ordered(self.ts)
+        lo, hi = bisect_left(ts, t_from), bisect_right(ts, t_to)
+        return ts[lo:hi], self._ordered(self.temp)[lo:hi], self._ordered(self.code)[lo:hi], self._ordered(self.icon)[lo:hi]
+
+
+def _clamp16(value: int) -> int:
+    return max(-32768, min(32767, int(value)))
+
+
+def aggregate(ts: array, values: array, step: int) -> List[dict]:
+    """min / max / mean / n по интервалам длиной step секунд (ts отсортированы)."""
+    if not ts:
+        return []
+    # numpy необязателен (без него — чистый Python) и грузится при первом запросе агрегатов
+    np = optional("numpy")
+    if np is not None:
+        t = np.frombuffer(ts, dtype=np.uint32).astype(np.int64)
+        v = np.frombuffer(values, dtype=np.int16).astype(np.float64)
+        buckets = t // step
+        # начала групп: интервалы идут подряд, потому что ts отсортированы
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.diff(np.r_[starts, len(t)])
+        sums = np.add.reduceat(v, starts)
+        return [
+            {"t": int(b) * step, "min": int(mn), "max": int(mx), "mean": round(float(s / n), 1), "n": int(n)}
+            for b, mn, mx, s, n in zip(
+                buckets[starts], np.minimum.reduceat(v, starts), np.maximum.reduceat(v, starts), sums, counts
+            )
+        ]
+    result = []
+    for bucket, group in groupby(zip(ts, values), key=lambda tv: tv[0] // step):
+        vals = [v for _, v in group]
+        result.append({"t": bucket * step, "min": min(vals), "max": max(vals),
+                       "mean": round(sum(vals) / len(vals), 1), "n": len(vals)})
+    return result
+
+
+class HistoryStore:
+    """
+    История по ключам районов. record() подходит как подписчик api.add_listener.
+    Новые показания копятся в памяти и раз в flush_interval дописываются в
+    <directory>/<ключ>.bin в отдельном потоке; при старте load() читает хвосты файлов.
+    Файлы общие для всех воркеров: пачки разных процессов в файле перемежаются,
+    поэтому load() сортирует записи по времени и убирает повторы, а дозапись и сжатие
+    файлов идут под межпроцессной блокировкой <directory>/.lock.
+    """
+
+    def __init__(self, directory: str, keys: Iterable[str], capacity: int = HISTORY_SIZE,
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._keys = set(keys)
+        self._series: Dict[str, RingSeries] = {}
+        self._icons = _Icons()
+        self._pending: Dict[str, List[bytes]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _get_series(self, key: str) -> RingSeries:
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = RingSeries(self.capacity)
+        return series
+
+    def _append(self, key: str, ts: int, temp: int, code: int, icon: str) -> bool:
+        series = self._get_series(key)
+        if series.count and ts <= series.last_ts():
+            return False   # не нарушаем порядок времени в буфере: на нём держится bisect в select()
+        series.append(ts, _clamp16(temp), code & 0xFFFF, self._icons.index(icon))
+        return True
+
+    def record(self, key: str, data: dict, ts: float) -> None:
+        if key not in self._keys:
+            return
+        ts = int(ts)
+        temp = int(data.get("temp") or 0)
+        code = int(data.get("code") or 0)
+        # "/icons/c01d.png" -> "c01d" (в файле под иконку 4 байта)
+        icon = os.path.splitext(os.path.basename(str(data.get("icon") or "")))[0][:4]
+        if not self._append(key, ts, temp, code, icon):
+            return
+        if self.directory:
+            self._pending.setdefault(key, []).append(
+                _RECORD.pack(ts, _clamp16(temp), code & 0xFFFF, icon.encode("ascii", "replace")))
+
+    def query(self, key: str, t_from: int, t_to: int, step: Optional[str] = None) -> List[dict]:
+        """Показания за [t_from, t_to]: сырые (step=None) или агрегаты по "hour" / "day"."""
+        series = self._series.get(key)
+        if series is None:
+            return []
+        ts, temp, code, icon = series.select(t_from, t_to)
+        if step:
+            return aggregate(ts, temp, STEPS[step])
+        names = self._icons.names
+        return [{"ts": t, "temp": v, "code": c, "icon": names[i]} for t, v, c, i in zip(ts, temp, code, icon)]
+
+    def stats(self) -> dict:
+        samples = sum(s.count for s in self._series.values())
+        return {"regions": len(self._series), "samples": samples, "bytes_per_sample": 9}
+
+    # --- диск ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    @contextmanager
+    def _locked(self):
+        """Межпроцессная блокировка файлов истории (fcntl; на Windows её нет — только один воркер)."""
+        fcntl = optional("fcntl")
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_sorted(path: str, limit: int) -> List[Tuple[int, int, int, bytes]]:
+        """Последние (по времени) limit записей файла без повторов, по возрастанию времени."""
+        with open(path, "rb") as f:
+            raw = f.read()
+        raw = raw[:len(raw) - len(raw) % _RECORD.size]
+        # пачки разных воркеров перемежаются; одно и то же показание из общего кэша пишет каждый воркер
+        records = sorted({r[0]: r for r in _RECORD.iter_unpack(raw)}.values())
+        return records[-limit:]
+
+    def load(self) -> int:
+        """Прочитать последние capacity показаний каждого района с диска (блокирующий вызов)."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        loaded = 0
+        with self._locked():
+            for key in self._keys:
+                path = self._path(key)
+                if not os.path.isfile(path):
+                    continue
+                for ts, temp, code, icon in self._read_sorted(path, self.capacity):
+                    if self._append(key, ts, temp, code, icon.decode("ascii", "replace").rstrip("\x00")):
+                        loaded += 1
+        return loaded
+
+    def _write(self, batch: Dict[str, List[bytes]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # под блокировкой: иначе запись другого воркера в старый файл потеряется при os.replace
+        with self._locked():
+            for key, records in batch.items():
+                path = self._path(key)
+                with open(path, "ab") as f:
+                    f.write(b"".join(records))
+                    size = f.tell()
+                # файл дописывается бесконечно — иногда оставляем только последние capacity записей
+                if size > 4 * self.capacity * _RECORD.size:
+                    tail = self._read_sorted(path, self.capacity)
+                    tmp = path + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(b"".join(_RECORD.pack(*r) for r in tail))
+                    os.replace(tmp, path)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except OSError as exc:
+            logger.error("Не удалось сохранить историю в %s: %s", self.directory, exc)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self.directory and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,37 @@
+# httpcache.py
+# Общие помощники для условных запросов (ETag / Last-Modified / 304)
+# Запуск: используется импортом из pages.py и main.py
+
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from starlette.requests import Request
+
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому."""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def http_date(ts: float) -> str:
+    return formatdate(ts, usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, mtime: Optional[float] = None) -> bool:
+    """
+    True, если у клиента актуальная копия: If-None-Match совпадает с etag
+    или (при отсутствии If-None-Match) If-Modified-Since не раньше mtime.
+    """
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        # слабое сравнение W/"..." допустимо для GET (RFC 9110, 13.1.2)
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if ims and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
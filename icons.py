@@ -0,0 +1,147 @@
+# icons.py
+# Локальная копия иконок погоды Weatherbit: загрузка один раз, хранение на диске, отдача с ETag
+# Запуск: используется импортом из main.py
+
+import os
+import re
+import base64
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from cache import SingleFlight
+from httpcache import http_date, is_not_modified, make_etag
+
+logger = logging.getLogger("icons")
+
+# Откуда брать иконки ({code} — код вида "c01d"); для офлайн-проверок можно указать локальную заглушку
+ICON_SOURCE_URL = os.getenv("WEATHERBIT_ICON_URL", "https://www.weatherbit.io/static/img/icons/{code}.png")
+ICON_DIR = os.getenv("WEATHER_ICON_DIR", "icons")                        # пустая строка — только память
+ICON_INLINE_MAX = int(os.getenv("WEATHER_ICON_INLINE_MAX", "8192"))     # иконки не больше — в data URI / спрайт
+# Иконка с данным кодом не меняется, поэтому кэшируется браузером навсегда
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Коды Weatherbit: буква группы, две цифры, d/n (день / ночь)
+_CODE_RE = re.compile(r"^[a-z]\d{2}[dn]$")
+
+
+class Icon:
+    __slots__ = ("code", "body", "etag", "mtime")
+
+    def __init__(self, code: str, body: bytes, mtime: float):
+        self.code = code
+        self.body = body
+        self.etag = make_etag(body)
+        self.mtime = mtime
+
+    def data_uri(self) -> str:
+        return "data:image/png;base64," + base64.b64encode(self.body).decode("ascii")
+
+
+class IconStore:
+    """
+    Иконки по коду: память -> файл <directory>/<код>.png -> источник (один запрос на код,
+    одновременные запросы ждут его результата). fetch(адрес) -> (тело, Content-Type).
+    """
+
+    def __init__(self, directory: str, fetch: Callable[[str], Awaitable[Tuple[bytes, str]]],
+                 source_url: str = ICON_SOURCE_URL, inline_max: int = ICON_INLINE_MAX):
+        self.directory = directory
+        self.source_url = source_url
+        self.inline_max = inline_max
+        self._fetch = fetch
+        self._icons: Dict[str, Icon] = {}
+        self._flights = SingleFlight()
+        self._sprite: Optional[Tuple[int, bytes, str]] = None   # (число иконок, css, etag)
+        self.fetched = 0
+
+    @staticmethod
+    def valid(code: str) -> bool:
+        return bool(_CODE_RE.match(code))
+
+    def _path(self, code: str) -> str:
+        return os.path.join(self.directory, f"{code}.png")
+
+    def load(self) -> int:
+        """Прочитать сохранённые иконки с диска (блокирующий вызов, при старте)."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        for name in os.listdir(self.directory):
+            code, ext = os.path.splitext(name)
+            if ext != ".png" or not self.valid(code):
+                continue
+            path = self._path(code)
+            with open(path, "rb") as f:
+                self._icons[code] = Icon(code, f.read(), os.path.getmtime(path))
+        return len(self._icons)
+
+    def _save(self, code: str, body: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(code) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, self._path(code))
+
+    async def _download(self, code: str) -> Icon:
+        body, content_type = await self._fetch(self.source_url.format(code=code))
+        if not body or (content_type and not content_type.startswith("image/")):
+            raise RuntimeError(f"Источник вернул не изображение для {code}: {content_type or 'пустой ответ'}")
+        icon = Icon(code, body, time.time())
+        if self.directory:
+            try:
+                await asyncio.to_thread(self._save, code, body)
+            except OSError as exc:
+                logger.error("Не удалось сохранить иконку %s: %s", code, exc)
+        self._icons[code] = icon
+        self.fetched += 1
+        logger.info("Иконка %s загружена (%d байт)", code, len(body))
+        return icon
+
+    async def get(self, code: str) -> Icon:
+        """Иконка по коду; ValueError — некорректный код, RuntimeError — источник недоступен."""
+        if not self.valid(code):
+            raise ValueError("Некорректный код иконки")
+        icon = self._icons.get(code)
+        if icon is None:
+            icon = await self._flights.do(code, lambda: self._download(code))
+        return icon
+
+    def data_uri(self, code: str) -> Optional[str]:
+        """data: URI уже загруженной небольшой иконки, иначе None (тогда используется /icons/<код>.png)."""
+        icon = self._icons.get(code)
+        if icon is None or len(icon.body) > self.inline_max:
+            return None
+        return icon.data_uri()
+
+    def sprite(self) -> Tuple[bytes, str]:
+        """CSS со всеми загруженными небольшими иконками: .wi-<код> { background-image: url(data:...) }."""
+        if self._sprite is None or self._sprite[0] != len(self._icons):
+            rules = [
+                f".wi-{code}{{background-image:url({icon.data_uri()})}}"
+                for code, icon in sorted(self._icons.items()) if len(icon.body) <= self.inline_max
+            ]
+            css = "\n".join(rules).encode("utf-8")
+            self._sprite = (len(self._icons), css, make_etag(css))
+        return self._sprite[1], self._sprite[2]
+
+    def stats(self) -> dict:
+        return {"icons": len(self._icons), "fetched": self.fetched, "directory": self.directory or None}
+
+    async def response(self, request: Request, code: str) -> Response:
+        icon = await self.get(code)
+        headers = {"ETag": icon.etag, "Last-Modified": http_date(icon.mtime), "Cache-Control": IMMUTABLE}
+        if is_not_modified(request, icon.etag, icon.mtime):
+            return Response(status_code=304, headers=headers)
+        return Response(icon.body, media_type="image/png", headers=headers)
+
+    def sprite_response(self, request: Request) -> Response:
+        # набор иконок растёт по мере загрузки, поэтому спрайт перепроверяется по ETag
+        css, etag = self.sprite()
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if is_not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(css, media_type="text/css; charset=utf-8", headers=headers)
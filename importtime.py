@@ -0,0 +1,99 @@
+# importtime.py
+# Отчёт о времени импорта приложения (python -X importtime) и проверка бюджета холодного старта
+# Запуск: python importtime.py [--top 20] [--budget 1500] [--runs 3] [--json importtime.json]
+#         код выхода 1, если старт дольше бюджета или при старте импортирован модуль из --forbid
+#         (эту проверку выполняет tests/test_startup.py)
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+# Что не должно импортироваться при старте: не нужно рабочим маршрутам или грузится при первом использовании
+DEFAULT_FORBID = "turtle,tkinter,requests_cache,requests,numpy"
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "3000"))   # 0 — не проверять
+
+
+def measure(module: str) -> List[Tuple[str, int, int, int]]:
+    """Импорт module в чистом интерпретаторе -> [(модуль, глубина, собственное мкс, суммарное мкс)]."""
+    env = dict(os.environ)
+    env.setdefault("WEATHER_REFRESH", "0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"Не удалось импортировать {module}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def by_package(rows: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """Собственное время импорта, сложенное по пакетам верхнего уровня (fastapi, pydantic, ...), мкс."""
+    totals: Dict[str, int] = {}
+    for name, _, self_us, _ in rows:
+        top = name.split(".")[0]
+        totals[top] = totals.get(top, 0) + self_us
+    return totals
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Время импорта приложения по модулям и проверка бюджета")
+    parser.add_argument("--module", default="main", help="что импортировать (по умолчанию main)")
+    parser.add_argument("--top", type=int, default=20, help="сколько строк в таблицах")
+    parser.add_argument("--runs", type=int, default=3, help="повторов; берётся самый быстрый (меньше шума)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS,
+                        help="бюджет времени импорта, мс (0 — не проверять; по умолчанию IMPORT_BUDGET_MS)")
+    parser.add_argument("--forbid", default=DEFAULT_FORBID, help="модули, которых не должно быть при старте")
+    parser.add_argument("--json", default=None, help="сохранить отчёт в файл")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.module) for _ in range(max(1, args.runs))]
+    total = lambda rows: next((cum for name, depth, _, cum in rows if name == args.module and depth == 0), 0)
+    rows = min(runs, key=total)
+    total_ms = total(rows) / 1000
+
+    print(f"Импорт {args.module}: {total_ms:.1f} мс (лучший из {len(runs)}), модулей: {len(rows)}\n")
+    print("По пакетам (собственное время):")
+    for package, us in sorted(by_package(rows).items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {us / 1000:>9.1f} мс  {package}")
+    print("\nПрямые импорты приложения (суммарное время):")
+    direct = [r for r in rows if r[1] == 1] or rows
+    for name, _, _, cumulative_us in sorted(direct, key=lambda r: -r[3])[:args.top]:
+        print(f"  {cumulative_us / 1000:>9.1f} мс  {name}")
+
+    failed = False
+    imported = {name for name, *_ in rows}
+    forbidden = [m for m in (s.strip() for s in args.forbid.split(",")) if m and m in imported]
+    if forbidden:
+        print(f"\nОШИБКА: при старте импортированы {', '.join(forbidden)}")
+        failed = True
+    if args.budget > 0:
+        verdict = "в пределах" if total_ms <= args.budget else "ПРЕВЫШЕН"
+        print(f"\nБюджет {args.budget:.0f} мс: {verdict} ({total_ms:.1f} мс)")
+        failed = failed or total_ms > args.budget
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "module": args.module,
+                "total_ms": total_ms,
+                "budget_ms": args.budget or None,
+                "forbidden_imported": forbidden,
+                "packages_ms": {k: v / 1000 for k, v in sorted(by_package(rows).items(), key=lambda kv: -kv[1])},
+                "modules": [{"name": n, "depth": d, "self_ms": s / 1000, "cumulative_ms": c / 1000} for n, d, s, c in rows],
+            }, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
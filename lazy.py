@@ -0,0 +1,23 @@
+# lazy.py
+# Отложенный импорт необязательных тяжёлых зависимостей (numpy и т.п.): модуль грузится при первом использовании
+# Запуск: используется импортом из stats.py и history.py
+
+import importlib
+from types import ModuleType
+from typing import Dict, Optional
+
+_modules: Dict[str, Optional[ModuleType]] = {}
+
+
+def optional(name: str) -> Optional[ModuleType]:
+    """Модуль name или None, если он не установлен; импорт выполняется один раз, при первом вызове."""
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+    _modules[name] = module
+    return module
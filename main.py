@@ -1,25 +1,116 @@
 # python -m uvicorn main:app --reload
+import asyncio
+import functools
 import hashlib
+import json
+import time
+from datetime import datetime
 import os
 import logging
-import mimetypes
-from turtle import pd
-from typing import Callable, List
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
 import uuid
 
-from fastapi import FastAPI, Form, Request, Path, HTTPException
-from fastapi.responses import HTMLResponse, PlainTextResponse, FileResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Form, Request, Path, Query, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from jinja2 import TemplateNotFound
-from requests_cache import datetime, timedelta
 
-from api import data_url   # импортируем нашу функцию погоды
+from api import (   # импортируем нашу функцию погоды
+    coord, oblasts, data_url_async, data_json_async, data_many_json_async, encode_json, refresh_region,
+    region_age, close_client, cache_stats,
+    add_listener, warm_cache, set_shared_backend, breaker_status, nearest_region, cached_reading,
+    resolve_region, fetch_bytes, init_client, icon_url, quota_status, ttl_multiplier, CACHE_BACKEND, STALE_TTL,
+    BATCH_CONCURRENCY,
+)
+from refresh import REFRESH_ENABLED, REFRESH_INTERVAL, Refresher
+from store import STORE_PATH, SnapshotStore
+from pages import PageCache
+from assets import AssetStore, accepted_encodings
+from events import Broadcaster
+from history import HISTORY_DIR, STEPS, HistoryStore
+from stats import OblastStats
+from icons import ICON_DIR, IconStore
+from httpcache import is_not_modified, make_etag
+import export
+import metrics
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger("main")
 
-app = FastAPI()
+# Фоновое обновление всех районов: пользовательские запросы берут данные из памяти.
+# Район, который другой воркер обновил менее REFRESH_INTERVAL назад, берётся из общего кэша
+# При нехватке квоты API период обновления растёт вместе с TTL кэша
+refresher = Refresher(coord, functools.partial(refresh_region, max_age=REFRESH_INTERVAL), region_age,
+                      scale=ttl_multiplier)
+
+# Последние показания на диске: после перезапуска кэш сразу тёплый
+store = SnapshotStore(STORE_PATH) if STORE_PATH else None
+if store is not None:
+    add_listener(store.put, shared=False)   # данные из L2 уже лежат в этом же файле
+    if CACHE_BACKEND == "sqlite":
+        set_shared_backend(store)
+        logger.info("Общий кэш воркеров: %s", STORE_PATH)
+elif CACHE_BACKEND == "sqlite":
+    logger.warning("WEATHER_CACHE_BACKEND=sqlite требует WEATHER_STORE_PATH, используется кэш в памяти")
+
+# Рассылка изменений подписчикам /weather/stream и /ws/weather: одно обновление района
+# (фоновое или по запросу) — одно событие всем подписчикам этого района
+broadcaster = Broadcaster()
+add_listener(broadcaster.publish)
+
+# История показаний районов (только ключи coord, произвольные координаты не копятся)
+history = HistoryStore(HISTORY_DIR, coord)
+add_listener(history.record)
+
+# Сводка температур по областям и стране, обновляется по мере обновления районов
+oblast_stats = OblastStats(oblasts)
+add_listener(oblast_stats.update)
+
+# Иконки погоды загружаются с Weatherbit один раз и дальше отдаются с диска / из памяти
+icon_store = IconStore(ICON_DIR, fetch_bytes)
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # пул соединений к Weatherbit создаётся здесь, а не при импорте модулей
+    init_client()
+    if store is not None:
+        try:
+            loaded = warm_cache(await asyncio.to_thread(store.load_all))
+            logger.info("Загружено из %s: %d записей", STORE_PATH, loaded)
+        except Exception:
+            logger.exception("Не удалось загрузить сохранённые данные из %s", STORE_PATH)
+        store.start()
+        for region_id in coord:
+            data = cached_reading(region_id)
+            if data is not None:
+                oblast_stats.update(region_id, data)
+        if PRERENDER:
+            # страницы отрендерены при импорте, до загрузки снимка
+            for tmpl in _TEMPLATE_CITY:
+                pages.invalidate(tmpl)
+    try:
+        logger.info("История: загружено %d показаний", await asyncio.to_thread(history.load))
+    except Exception:
+        logger.exception("Не удалось загрузить историю из %s", HISTORY_DIR)
+    history.start()
+    try:
+        logger.info("Иконки: загружено %d с диска", await asyncio.to_thread(icon_store.load))
+    except OSError:
+        logger.exception("Не удалось прочитать иконки из %s", ICON_DIR)
+    if REFRESH_ENABLED:
+        refresher.start()
+    yield
+    await refresher.stop()
+    await history.stop()
+    if store is not None:
+        await store.stop()
+    # закрываем пул соединений к Weatherbit
+    await close_client()
+
+app = FastAPI(lifespan=lifespan)
+# время ответа по маршрутам для /metrics (чистый ASGI, без @app.middleware("http"))
+app.add_middleware(metrics.LatencyMiddleware)
 
 TEMPLATES_DIR = "templates"
 STATIC_DIR = "static"
@@ -29,34 +120,112 @@ for d in (TEMPLATES_DIR, STATIC_DIR, IMGS_DIR):
     if not os.path.isdir(d):
         logger.warning("Директория не найдена: %s", d)
 
-try:
-    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-    logger.info("Mounted /static -> %s", STATIC_DIR)
-except Exception as exc:
-    logger.exception("Не удалось смонтировать /static: %s", exc)
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-try:
-    app.mount("/imgs", StaticFiles(directory=IMGS_DIR), name="imgs")
-    logger.info("Mounted /imgs -> %s", IMGS_DIR)
-except Exception as exc:
-    logger.exception("Не удалось смонтировать /imgs: %s", exc)
+# Статика отдаётся из памяти с gzip/brotli; адреса из static()/img() содержат хэш
+# содержимого (?v=...), поэтому такие ответы кэшируются браузером навсегда
+# Индекс каталогов строится при старте: поиск файла по запросу — обращение к словарю
+static_assets = AssetStore(STATIC_DIR, "/static")
+img_assets = AssetStore(IMGS_DIR, "/imgs")
+static_assets.scan()
+img_assets.scan()
 
-templates = Jinja2Templates(directory=TEMPLATES_DIR)
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], name="static")
+async def static_file(request: Request, path: str):
+    try:
+        return static_assets.response(request, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Файл не найден")
 
-def _static_url(path: str) -> str:
-    return f"/static/{path.lstrip('/')}"
-templates.env.globals['static'] = _static_url
+@app.api_route("/imgs/{path:path}", methods=["GET", "HEAD"], name="imgs")
+async def imgs_file(request: Request, path: str):
+    try:
+        return img_assets.response(request, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Файл не найден")
+
+templates.env.globals['static'] = static_assets.url
+templates.env.globals['img'] = img_assets.url
+templates.env.globals['icon_uri'] = icon_store.data_uri
 
-def _img_url(path: str) -> str:
-    return f"/imgs/{path.lstrip('/')}"
-templates.env.globals['img'] = _img_url
+# Все загруженные иконки одним CSS-файлом с data: URI (классы .wi-<код>).
+# Объявлен до /icons/{name}, иначе "sprite.css" будет принят за код иконки
+@app.get("/icons/sprite.css", name="icon_sprite")
+async def icon_sprite(request: Request):
+    return icon_store.sprite_response(request)
+
+@app.get("/icons/{name}", name="icon")
+async def icon_file(request: Request, name: str):
+    code = name[:-4] if name.endswith(".png") else name
+    try:
+        return await icon_store.response(request, code)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
 
 CITIES: List[str] = ["gomel", "minsk", "mogilev", "vitebsk", "grodno", "brest"]
 
+# Готовые страницы: шаблон для каждого города ищется один раз при старте, HTML рендерится
+# один раз и отдаётся из памяти (с ETag / 304), пока не изменится файл шаблона
+# (и заново, если изменились файлы, на которые страница ссылается через static()/img())
+# WEATHER_PRERENDER=1: в страницу области встраиваются последние показания всех её районов
+# (первый клик не ждёт запроса к /weather); страница перерендеривается, только когда
+# показания какого-либо района области отличаются от встроенных.
+# Встраиваются только показания моложе STALE_TTL (не снимок многодневной давности после рестарта);
+# когда самое старое из встроенных доживает до STALE_TTL, страница тоже перерендеривается
+PRERENDER = os.getenv("WEATHER_PRERENDER", "0").strip().lower() in ("1", "true", "yes")
+_embedded: dict = {}         # город -> показания, встроенные в его текущую страницу
+_embedded_until: dict = {}   # город -> time.monotonic(), когда встроенные показания устареют
+
+def _page_context(name: str) -> dict:
+    city = _TEMPLATE_CITY.get(name) if PRERENDER else None
+    if city is None:
+        return {}
+    readings = {}
+    oldest = None
+    for region_id in oblasts[city]:
+        age = region_age(region_id)
+        if age is None or age >= STALE_TTL:
+            continue
+        data = cached_reading(region_id)
+        if data is not None:
+            readings[region_id] = data
+            oldest = age if oldest is None else max(oldest, age)
+    _embedded[city] = readings
+    if oldest is None:
+        _embedded_until.pop(city, None)
+    else:
+        _embedded_until[city] = time.monotonic() + STALE_TTL - oldest
+    return {"readings": readings}
+
+def _expire_embedded(city: str) -> None:
+    until = _embedded_until.get(city)
+    if until is not None and time.monotonic() >= until:
+        del _embedded_until[city]
+        _embedded.pop(city, None)
+        pages.invalidate(CITY_TEMPLATES[city])
+
+def _on_reading(key: str, data: dict, ts: float) -> None:
+    city = _CITY_OF_REGION.get(key)
+    if city is not None and city in _embedded and _embedded[city].get(key) != data:
+        del _embedded[city]
+        pages.invalidate(CITY_TEMPLATES[city])
+
+pages = PageCache(templates.env, TEMPLATES_DIR,
+                  signature=lambda: (static_assets.generation(), img_assets.generation()),
+                  context=_page_context)
+CITY_TEMPLATES = {c: pages.resolve([f"{c}.html", f"{c}.htm"]) or "main.html" for c in CITIES}
+_TEMPLATE_CITY = {tmpl: c for c, tmpl in CITY_TEMPLATES.items() if tmpl != "main.html" and c in oblasts}
+_CITY_OF_REGION = {region_id: c for c in _TEMPLATE_CITY.values() for region_id in oblasts[c]}
+if PRERENDER:
+    add_listener(_on_reading)
+pages.prerender(["main.html", *CITY_TEMPLATES.values()])
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     try:
-        return templates.TemplateResponse("main.html", {"request": request})
+        return pages.response(request, "main.html")
     except TemplateNotFound:
         logger.error("templates/main.html не найден")
         return HTMLResponse("<h1>Главная страница не найдена (templates/main.html)</h1>", status_code=200)
@@ -68,38 +237,277 @@ async def index(request: Request):
 async def health():
     return "ok"
 
+BATCH_MAX_IDS = 200
+
+def _json_response(request: Request, body: bytes, etag: Optional[str] = None) -> Response:
+    """Готовое JSON-тело с ETag; 304 без тела, если у клиента та же версия."""
+    etag = etag or make_etag(body)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+def _batch_response(request: Request, results: dict, errors: dict) -> Response:
+    # {"results": {...}, "errors": {...}} склеивается из готовых JSON-фрагментов районов
+    parts = [encode_json(region_id) + b":" + body for region_id, body in results.items()]
+    body = b'{"results":{' + b",".join(parts) + b'},"errors":' + encode_json(errors) + b"}"
+    return _json_response(request, body)
+
+# Пакетный запрос: /weather/batch?ids=gom,br,moz (координаты — через двоеточие: 52.43:30.98)
+# Объявлен до /weather/{region_id}, иначе "batch" будет принят за region_id
+@app.get("/weather/batch", response_class=JSONResponse)
+async def weather_batch(request: Request, ids: List[str] = Query(..., description="region_id через запятую или повтором параметра")):
+    region_ids = [r.strip() for item in ids for r in item.split(",") if r.strip()]
+    if not region_ids:
+        raise HTTPException(status_code=400, detail="Не указаны ids")
+    if len(region_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Слишком много ids (максимум {BATCH_MAX_IDS})")
+    return _batch_response(request, *await data_many_json_async(region_ids))
+
+# Все районы области: /weather/oblast/gomel
+@app.get("/weather/oblast/{city}", response_class=JSONResponse)
+async def weather_oblast(request: Request, city: str):
+    region_ids = oblasts.get(city.strip().lower())
+    if region_ids is None:
+        raise HTTPException(status_code=404, detail="Неизвестная область")
+    return _batch_response(request, *await data_many_json_async(region_ids))
+
+# Сводка по областям и стране: /weather/aggregate или /weather/aggregate?oblast=gomel
+@app.get("/weather/aggregate", response_class=JSONResponse)
+async def weather_aggregate(oblast: Optional[str] = None):
+    try:
+        return JSONResponse(oblast_stats.summary(oblast.strip().lower() if oblast else None))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Неизвестная область")
+
+_OBLAST_OF = {region_id: city for city, ids in oblasts.items() for region_id in ids}
+
+# Выгрузка всех районов: /weather/export?format=csv&oblast=gomel&history=24
+# Строки уходят по мере готовности районов, ответ не собирается в памяти целиком.
+# Объявлен до /weather/{region_id}, иначе "export" будет принят за region_id
+@app.get("/weather/export")
+async def weather_export(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson или csv"),
+    oblast: str = Query("", description="только районы этой области"),
+    history_hours: float = Query(0, alias="history", ge=0, le=24 * 30, description="добавить историю за столько часов"),
+    cached: bool = Query(False, description="только данные из кэша, без запросов к API"),
+):
+    fmt = format.strip().lower()
+    if fmt not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="format: ndjson или csv")
+    if oblast:
+        region_ids = oblasts.get(oblast.strip().lower())
+        if region_ids is None:
+            raise HTTPException(status_code=404, detail="Неизвестная область")
+    else:
+        region_ids = list(coord)
+
+    async def from_cache(region_id: str) -> dict:
+        data = cached_reading(region_id)
+        if data is None:
+            raise RuntimeError("Нет данных в кэше")
+        return data
+
+    def history_of(region_id: str) -> List[dict]:
+        t_to = int(time.time())
+        items = history.query(region_id, t_to - int(history_hours * 3600), t_to)
+        for item in items:
+            item["icon"] = icon_url(item["icon"])
+        return items
+
+    rows = export.export_rows(
+        region_ids,
+        from_cache if cached else data_url_async,
+        _OBLAST_OF,
+        region_age,
+        history_of if history_hours > 0 else None,
+        concurrency=BATCH_CONCURRENCY,
+    )
+    compress = accepted_encodings(request.headers.get("accept-encoding", "")).get("gzip", 0) > 0
+    headers = {
+        "Cache-Control": "no-store",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="weather-{time.strftime("%Y%m%d-%H%M")}.{fmt}"',
+        "X-Accel-Buffering": "no",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export.encode(rows, fmt, compress), media_type=export.FORMATS[fmt], headers=headers)
+
+STREAM_HEARTBEAT = 15   # секунд между пустыми сообщениями, чтобы прокси не закрывали соединение
+
+def _subscription_keys(ids: str, oblast: str) -> List[str]:
+    """Ключи кэша для подписки: районы из ids (через запятую) и/или все районы области."""
+    keys = []
+    if oblast:
+        region_ids = oblasts.get(oblast.strip().lower())
+        if region_ids is None:
+            raise ValueError("Неизвестная область")
+        keys.extend(region_ids)
+    for region_id in ids.split(","):
+        if region_id.strip():
+            keys.append(resolve_region(region_id)[0])
+    if not keys:
+        raise ValueError("Не указаны ids или oblast")
+    return keys
+
+def _initial_events(keys: List[str]):
+    """Текущие данные из кэша, чтобы подписчик сразу получил состояние, не дожидаясь изменений."""
+    for key in keys:
+        data = cached_reading(key)
+        if data is not None:
+            yield key, data
+
+def _sse(key: str, data: dict) -> str:
+    payload = json.dumps({"region_id": key, **data}, ensure_ascii=False)
+    return f"event: weather\nid: {key}\ndata: {payload}\n\n"
+
+# Поток изменений (Server-Sent Events): /weather/stream?ids=gom,br или /weather/stream?oblast=gomel
+@app.get("/weather/stream")
+async def weather_stream(request: Request, ids: str = "", oblast: str = ""):
+    try:
+        keys = _subscription_keys(ids, oblast)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        with broadcaster.subscribe(keys) as queue:
+            for key, data in _initial_events(keys):
+                yield _sse(key, data)
+            while not await request.is_disconnected():
+                event = await broadcaster.next_event(queue, STREAM_HEARTBEAT)
+                yield ": ping\n\n" if event is None else _sse(*event)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# То же через WebSocket: /ws/weather?oblast=gomel — сервер присылает JSON при каждом изменении
+@app.websocket("/ws/weather")
+async def weather_ws(websocket: WebSocket, ids: str = "", oblast: str = ""):
+    try:
+        keys = _subscription_keys(ids, oblast)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket.accept()
+    with broadcaster.subscribe(keys) as queue:
+        for key, data in _initial_events(keys):
+            await websocket.send_json({"region_id": key, **data})
+        # входящие сообщения не нужны, но их чтение позволяет заметить закрытие соединения
+        receiver = asyncio.ensure_future(websocket.receive())
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    key, data = getter.result()
+                    await websocket.send_json({"region_id": key, **data})
+                else:
+                    getter.cancel()
+                if receiver in done:
+                    if receiver.result().get("type") == "websocket.disconnect":
+                        break
+                    receiver = asyncio.ensure_future(websocket.receive())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+
 # Новый эндпоинт для погоды
 @app.get("/weather/{region_id}", response_class=JSONResponse)
-async def weather(region_id: str):
+async def weather(request: Request, region_id: str):
+    # горячий путь: готовые байты и ETag из записи кэша, без сборки dict и сериализации
     try:
-        data = data_url(region_id)
-        return JSONResponse(data)
+        body, etag = await data_json_async(region_id)
+        return _json_response(request, body, etag)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=502, detail=str(e))
 
+# Ближайший район к точке: /nearest?lat=52.43&lon=31.0
+@app.get("/nearest", response_class=JSONResponse)
+async def nearest(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180)):
+    return JSONResponse(nearest_region(lat, lon))
+
+def _parse_time(value: Optional[str], default: float) -> int:
+    """Время из параметра запроса: unix-время в секундах или ISO 8601 ("2026-01-31T12:00")."""
+    if value is None or value == "":
+        return int(default)
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Некорректное время: {value}")
+
+# История района: /weather/gom/history?from=...&to=...&step=hour
+@app.get("/weather/{region_id}/history", response_class=JSONResponse)
+async def weather_history(
+    region_id: str,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    step: str = Query("raw", description="raw, hour или day"),
+):
+    if step != "raw" and step not in STEPS:
+        raise HTTPException(status_code=400, detail="step должен быть raw, hour или day")
+    try:
+        key = resolve_region(region_id)[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    t_to = _parse_time(to, time.time())
+    t_from = _parse_time(from_, t_to - 86400)
+    items = history.query(key, t_from, t_to, None if step == "raw" else step)
+    for item in items:
+        if "icon" in item:
+            item["icon"] = icon_url(item["icon"])   # в истории хранится код, наружу — тот же адрес, что в /weather
+    return JSONResponse({"region_id": key, "from": t_from, "to": t_to, "step": step, "items": items})
+
+@app.get("/cache/stats", response_class=JSONResponse)
+async def weather_cache_stats():
+    stats = cache_stats()
+    stats["history"] = history.stats()
+    stats["icons"] = icon_store.stats()
+    return JSONResponse(stats)
+
+@app.get("/upstream/status", response_class=JSONResponse)
+async def upstream_status():
+    return JSONResponse(breaker_status())
+
+@app.get("/budget", response_class=JSONResponse)
+async def upstream_budget():
+    return JSONResponse(quota_status())
+
+@app.get("/refresh/status", response_class=JSONResponse)
+async def refresh_status():
+    status = refresher.status()
+    status["stream"] = broadcaster.stats()
+    return JSONResponse(status)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 def make_city_handler(city_name: str) -> Callable[[Request], HTMLResponse]:
+    city = city_name.strip().lower()
+    tmpl = CITY_TEMPLATES.get(city, "main.html")
+    if tmpl == "main.html":
+        logger.info("Шаблон для %s не найден, используется main.html", city)
+
     async def handler(request: Request):
-        city = city_name.strip().lower()
-        candidates = [f"{city}.html", f"{city}.htm"]
-        for tmpl in candidates:
-            try:
-                return templates.TemplateResponse(tmpl, {"request": request})
-            except TemplateNotFound:
-                continue
-            except Exception:
-                logger.exception("Ошибка при рендеринге шаблона %s", tmpl)
-                raise HTTPException(status_code=500, detail="Ошибка сервера при рендеринге шаблона")
+        if PRERENDER:
+            _expire_embedded(city)
         try:
-            logger.info("Шаблон для %s не найден, возвращаем main.html", city)
-            return templates.TemplateResponse("main.html", {"request": request})
+            return pages.response(request, tmpl)
         except TemplateNotFound:
-            logger.error("templates/main.html не найден (fallback)")
+            logger.error("Шаблон %s не найден", tmpl)
             return HTMLResponse(f"<h1>Шаблон для {city} не найден</h1>", status_code=200)
         except Exception:
-            logger.exception("Ошибка при рендеринге main.html (fallback)")
-            raise HTTPException(status_code=500, detail="Ошибка сервера")
+            logger.exception("Ошибка при рендеринге шаблона %s", tmpl)
+            raise HTTPException(status_code=500, detail="Ошибка сервера при рендеринге шаблона")
     return handler
 
 for c in CITIES:
@@ -115,38 +523,55 @@ def _safe_imgs_path(filename: str) -> str:
     return os.path.join(IMGS_DIR, filename)
 
 @app.get("/images/{filename}", name="image_file")
-async def image_file(filename: str = Path(..., description="Имя файла в папке imgs")):
-    path = _safe_imgs_path(filename)
-    if not os.path.isfile(path):
+async def image_file(request: Request, filename: str = Path(..., description="Имя файла в папке imgs")):
+    _safe_imgs_path(filename)
+    try:
+        return img_assets.response(request, filename)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Файл не найден")
-    content_type, _ = mimetypes.guess_type(path)
-    return FileResponse(path, media_type=content_type or "application/octet-stream")
 
 CITY_IMAGE_MAP = {
     "gomel": "gomel.svg",
     "brest": "brest.png",
-    "minsk": "minsk.png",
-    "mogilev": "mogilev.png",
-    "vitebsk": "vitebsk.png",
+    "minsk": "minsk.svg",
+    "mogilev": "mogilev.svg",
+    "vitebsk": "vitebsk.svg",
     "grodno": "grodno.png",
 }
 
+def _validate_city_images() -> List[str]:
+    """Проверка при старте: города без картинки и ссылки на несуществующие файлы."""
+    problems = []
+    for city in CITIES:
+        filename = CITY_IMAGE_MAP.get(city)
+        if filename is None:
+            problems.append(f"{city}: изображение не задано")
+        elif filename not in img_assets:
+            problems.append(f"{city}: файл {IMGS_DIR}/{filename} не найден")
+    for problem in problems:
+        logger.warning("CITY_IMAGE_MAP: %s", problem)
+    if not problems:
+        logger.info("CITY_IMAGE_MAP: все %d изображений на месте", len(CITY_IMAGE_MAP))
+    return problems
+
+_validate_city_images()
+
 @app.get("/image/{city}", name="image_by_city")
-async def image_by_city(city: str = Path(..., description="Код города")):
+async def image_by_city(request: Request, city: str = Path(..., description="Код города")):
     city_key = city.strip().lower()
     filename = CITY_IMAGE_MAP.get(city_key)
     if not filename:
         raise HTTPException(status_code=404, detail="Изображение для города не задано")
-    path = _safe_imgs_path(filename)
-    if not os.path.isfile(path):
+    _safe_imgs_path(filename)
+    try:
+        return img_assets.response(request, filename)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Файл не найден")
-    content_type, _ = mimetypes.guess_type(path)
-    return FileResponse(path, media_type=content_type or "application/octet-stream")
 
 @app.get("/{other}", response_class=HTMLResponse)
 async def catch_all(request: Request, other: str):
     try:
-        return templates.TemplateResponse("main.html", {"request": request})
+        return pages.response(request, "main.html")
     except Exception:
         logger.exception("Ошибка в catch-all при рендеринге main.html")
         return HTMLResponse("<h1>Главная страница (fallback) недоступна</h1>", status_code=200)
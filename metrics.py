@@ -0,0 +1,170 @@
+# metrics.py
+# Метрики в текстовом формате Prometheus (/metrics) без внешних зависимостей
+# Запуск: используется импортом из api.py, pages.py, assets.py и main.py (LatencyMiddleware)
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        return []
+
+
+class Counter(_Metric):
+    """
+    Счётчик. Без блокировок: все вызовы идут из потока event loop,
+    а += над элементом словаря под GIL не теряет обновления в CPython.
+    С fn значение берётся при выдаче из уже существующего счётчика (например, TTLCache.hits).
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._fn = fn
+
+    def inc(self, amount: float = 1.0, *label_values: str) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        if self._fn is not None:
+            return [f"{self.name} {self._fn():g}"]
+        return [f"{self.name}{_labels_text(self.labels, k)} {v:g}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Текущее значение: задаётся set/inc/dec или вычисляется при выдаче функцией fn."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text)
+        self._value = 0.0
+        self._fn = fn
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._value -= amount
+
+    def _samples(self) -> List[str]:
+        value = self._fn() if self._fn is not None else self._value
+        return [f"{self.name} {value:g}"]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами; наблюдение — поиск корзины и два сложения."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # значения меток -> [счётчики по корзинам (+Inf последним), сумма]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, key)} {total:g}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- метрики конвейера погоды ---
+
+upstream_latency = Histogram("weather_upstream_seconds", "Длительность запроса к Weatherbit (с повторами)", ("outcome",))
+upstream_retries = Counter("weather_upstream_retries_total", "Повторные попытки запроса к Weatherbit", ("reason",))
+upstream_inflight = Gauge("weather_upstream_inflight", "Запросы к Weatherbit в полёте")
+render_latency = Histogram("page_render_seconds", "Время рендеринга шаблона страницы", ("template",))
+static_bytes = Counter("static_bytes_served_total", "Отданные байты статических файлов", ("encoding",))
+http_latency = Histogram("http_request_seconds", "Длительность обработки HTTP-запроса", ("route", "method", "status"))
+
+
+class LatencyMiddleware:
+    """
+    ASGI-middleware для http_latency: время до начала ответа (заголовков) по шаблону маршрута
+    ("/weather/{region_id}", а не сам путь — число рядов ограничено), методу и статусу.
+    Обёртка только над send: ответ, в том числе потоковый (SSE, выгрузка), идёт клиенту
+    напрямую, без промежуточных потоков и задач BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app, histogram: Histogram = http_latency):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int) -> None:
+            nonlocal observed
+            observed = True
+            route = scope.get("route")
+            self.histogram.observe(time.perf_counter() - started, getattr(route, "path", "unmatched"),
+                                   scope["method"], str(status))
+
+        async def send_timed(message) -> None:
+            if message["type"] == "http.response.start" and not observed:
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if not observed:
+                observe(500)   # исключение до начала ответа
@@ -0,0 +1,145 @@
+# pages.py
+# Кэш готовых HTML-страниц: шаблоны без данных рендерятся один раз и отдаются как bytes
+# Запуск: используется импортом из main.py
+
+import os
+import logging
+import time
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from jinja2 import Environment, TemplateNotFound
+from starlette.requests import Request
+from starlette.responses import Response
+
+from httpcache import http_date, is_not_modified, make_etag
+from metrics import render_latency
+
+logger = logging.getLogger("pages")
+
+# Как часто (не чаще) проверять mtime файла шаблона, сек
+PAGE_CHECK_INTERVAL = float(os.getenv("PAGE_CHECK_INTERVAL", "1"))
+
+
+class Page:
+    """
+    Отрендеренная страница: тело, ETag, время изменения шаблона (mtime — для проверки файла)
+    и время для Last-Modified (modified; у страниц с контекстом — время рендеринга).
+    """
+
+    __slots__ = ("body", "etag", "mtime", "modified", "signature", "checked_at")
+
+    def __init__(self, body: bytes, mtime: float, signature: Hashable = None):
+        self.body = body
+        self.etag = make_etag(body)
+        self.mtime = mtime
+        self.modified = mtime
+        self.signature = signature
+        self.checked_at = time.monotonic()
+
+
+class PageCache:
+    """
+    Страницы из шаблонов, которым не нужен контекст запроса.
+    Каждая страница рендерится один раз; при изменении файла шаблона
+    (проверка mtime не чаще PAGE_CHECK_INTERVAL) — рендерится заново.
+    signature() — дополнительное условие: если её значение изменилось, страницы
+    тоже перерендериваются (например, изменился файл, на который ссылается шаблон).
+    context(имя) — переменные шаблона; если они поменялись, страницу сбрасывает invalidate().
+    """
+
+    def __init__(
+        self,
+        env: Environment,
+        directory: str,
+        check_interval: float = PAGE_CHECK_INTERVAL,
+        signature: Optional[Callable[[], Hashable]] = None,
+        context: Optional[Callable[[str], dict]] = None,
+    ):
+        self.env = env
+        self.directory = directory
+        self.check_interval = check_interval
+        self._signature = signature or (lambda: None)
+        self._context = context or (lambda name: {})
+        self._pages: Dict[str, Page] = {}
+        self._modified: Dict[str, Tuple[float, str]] = {}   # имя -> (Last-Modified, ETag) страниц с контекстом
+
+    def resolve(self, candidates: Iterable[str]) -> Optional[str]:
+        """Первый существующий шаблон из списка или None."""
+        for name in candidates:
+            if os.path.isfile(os.path.join(self.directory, name)):
+                return name
+        return None
+
+    def _mtime(self, name: str) -> float:
+        return os.stat(os.path.join(self.directory, name)).st_mtime
+
+    def _render(self, name: str) -> Page:
+        try:
+            mtime = self._mtime(name)
+        except OSError:
+            raise TemplateNotFound(name)
+        signature = self._signature()
+        context = self._context(name)
+        started = time.perf_counter()
+        body = self.env.get_template(name).render(request=None, **context).encode("utf-8")
+        render_latency.observe(time.perf_counter() - started, name)
+        page = Page(body, mtime, signature)
+        if context:
+            page.modified = self._context_modified(name, page.etag)
+        self._pages[name] = page
+        logger.info("Страница %s отрендерена (%d байт)", name, len(body))
+        return page
+
+    def _context_modified(self, name: str, etag: str) -> float:
+        """
+        Last-Modified страницы с данными: время рендеринга, а не шаблона, иначе клиент
+        с одним If-Modified-Since получит 304 и оставит старые данные. Не меняется, если тело
+        то же, и растёт минимум на секунду (точность HTTP-даты), если тело другое.
+        """
+        prev = self._modified.get(name)
+        if prev is not None and prev[1] == etag:
+            return prev[0]
+        modified = time.time()
+        if prev is not None and int(modified) <= int(prev[0]):
+            modified = int(prev[0]) + 1
+        self._modified[name] = (modified, etag)
+        return modified
+
+    def get(self, name: str) -> Page:
+        """Готовая страница; TemplateNotFound, если шаблона нет."""
+        page = self._pages.get(name)
+        if page is None:
+            return self._render(name)
+        now = time.monotonic()
+        if now - page.checked_at >= self.check_interval:
+            page.checked_at = now
+            try:
+                if self._mtime(name) != page.mtime or self._signature() != page.signature:
+                    return self._render(name)
+            except OSError:
+                self._pages.pop(name, None)
+                raise TemplateNotFound(name)
+        return page
+
+    def invalidate(self, name: str) -> None:
+        """Сбросить готовую страницу: следующий запрос отрендерит её заново."""
+        self._pages.pop(name, None)
+
+    def prerender(self, names: Iterable[str]) -> None:
+        for name in names:
+            try:
+                self.get(name)
+            except TemplateNotFound:
+                logger.warning("Шаблон не найден: %s", name)
+
+    def response(self, request: Request, name: str, status_code: int = 200) -> Response:
+        """HTML-ответ с ETag / Last-Modified; 304, если у клиента актуальная копия."""
+        page = self.get(name)
+        headers = {
+            "ETag": page.etag,
+            "Last-Modified": http_date(page.modified),
+            "Cache-Control": "no-cache",
+        }
+        if is_not_modified(request, page.etag, page.modified):
+            return Response(status_code=304, headers=headers)
+        return Response(page.body, status_code=status_code, media_type="text/html; charset=utf-8", headers=headers)
@@ -0,0 +1,175 @@
+# quota.py
+# Ограничение запросов к Weatherbit по квоте ключа: сутки + минута (token bucket), Retry-After
+# Запуск: используется импортом из api.py
+
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+logger = logging.getLogger("quota")
+
+# Во сколько раз удлинять TTL кэша в зависимости от доли оставшейся суточной квоты:
+# (доля не меньше, множитель) — первая подходящая строка
+TTL_STEPS = ((0.5, 1.0), (0.25, 2.0), (0.1, 4.0), (0.0, 8.0))
+
+
+class QuotaExceededError(RuntimeError):
+    """Квота API исчерпана или API попросил подождать (429): запрос не выполняется."""
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Retry-After в секундах (число секунд или HTTP-дата) или None, если заголовка нет / он некорректен."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class QuotaLimiter:
+    """
+    Каждый запрос к API (включая повторы) забирает токен.
+    daily      — запросов в сутки (UTC, как у Weatherbit), 0 — без ограничения;
+    per_minute — ёмкость "ведра", пополняется равномерно per_minute токенов в минуту, 0 — без ограничения.
+    Фоновые запросы (background=True) не трогают последние reserve суточной квоты и ведра —
+    они остаются пользовательским промахам кэша. Пользовательский запрос ждёт токен
+    не дольше max_wait секунд, фоновый отклоняется сразу.
+    После 429 block(Retry-After) останавливает все запросы на указанное время.
+    Счётчики — на процесс: при нескольких воркерах квоту нужно делить между ними.
+    """
+
+    def __init__(
+        self,
+        daily: int = 0,
+        per_minute: int = 0,
+        reserve: float = 0.2,
+        max_wait: float = 2.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.daily = daily
+        self.per_minute = per_minute
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._clock = clock
+        self._day = self._today()
+        self.used = 0
+        self._tokens = float(per_minute)
+        self._refilled_at = clock()
+        self._blocked_until = 0.0
+        self.rejected = 0
+        self.rejected_background = 0
+
+    def _today(self) -> int:
+        return int(self._clock() // 86400)
+
+    def _update(self) -> float:
+        now = self._clock()
+        day = int(now // 86400)
+        if day != self._day:
+            self._day, self.used = day, 0
+        if self.per_minute > 0:
+            rate = self.per_minute / 60.0
+            self._tokens = min(float(self.per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+        return now
+
+    def daily_left(self) -> Optional[int]:
+        if self.daily <= 0:
+            return None
+        self._update()
+        return max(0, self.daily - self.used)
+
+    def _wait_for(self, background: bool) -> Optional[float]:
+        """0 — токен можно взять сейчас, >0 — через сколько секунд, None — до конца суток нельзя."""
+        now = self._update()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.daily > 0:
+            floor = self.reserve * self.daily if background else 0.0
+            if self.daily - self.used <= floor:
+                return None
+        if self.per_minute > 0:
+            need = 1.0 + (self.reserve * self.per_minute if background else 0.0)
+            if self._tokens < need:
+                return (need - self._tokens) * 60.0 / self.per_minute
+        return 0.0
+
+    def _take(self) -> None:
+        self.used += 1
+        if self.per_minute > 0:
+            self._tokens -= 1.0
+
+    def _reject(self, background: bool, wait: Optional[float]) -> QuotaExceededError:
+        if background:
+            self.rejected_background += 1
+        else:
+            self.rejected += 1
+        if wait is None:
+            return QuotaExceededError("Суточная квота запросов к API исчерпана")
+        return QuotaExceededError(f"Лимит запросов к API, повтор через {wait:.0f} с")
+
+    def try_acquire(self, background: bool = False) -> bool:
+        """Взять токен без ожидания."""
+        wait = self._wait_for(background)
+        if wait == 0.0:
+            self._take()
+            return True
+        self._reject(background, wait)
+        return False
+
+    async def acquire(self, background: bool = False) -> None:
+        """Взять токен (пользовательский запрос ждёт до max_wait); QuotaExceededError, если нельзя."""
+        deadline = self._clock() + (0.0 if background else self.max_wait)
+        while True:
+            wait = self._wait_for(background)
+            if wait == 0.0:
+                self._take()
+                return
+            if wait is None or self._clock() + wait > deadline:
+                raise self._reject(background, wait)
+            await asyncio.sleep(wait)
+
+    def refund(self) -> None:
+        """Вернуть токен запроса, который так и не ушёл в API (например, разомкнут выключатель)."""
+        self.used = max(0, self.used - 1)
+        if self.per_minute > 0:
+            self._tokens = min(float(self.per_minute), self._tokens + 1.0)
+
+    def block(self, seconds: float) -> None:
+        """Не отправлять запросы seconds секунд (ответ 429 с Retry-After)."""
+        until = self._clock() + seconds
+        if until > self._blocked_until:
+            self._blocked_until = until
+            logger.warning("API ограничил частоту запросов: пауза %.0f с", seconds)
+
+    def ttl_multiplier(self) -> float:
+        left = self.daily_left()
+        if left is None:
+            return 1.0
+        fraction = left / self.daily
+        for threshold, multiplier in TTL_STEPS:
+            if fraction >= threshold:
+                return multiplier
+        return TTL_STEPS[-1][1]
+
+    def status(self) -> dict:
+        now = self._update()
+        return {
+            "daily_budget": self.daily or None,
+            "daily_used": self.used,
+            "daily_remaining": self.daily_left(),
+            "daily_reset_in": round((self._day + 1) * 86400 - now),
+            "minute_budget": self.per_minute or None,
+            "minute_tokens": round(self._tokens, 1) if self.per_minute > 0 else None,
+            "blocked_for": round(max(0.0, self._blocked_until - now), 1),
+            "ttl_multiplier": self.ttl_multiplier(),
+            "rejected": self.rejected,
+            "rejected_background": self.rejected_background,
+        }
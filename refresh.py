@@ -0,0 +1,120 @@
+# refresh.py
+# Фоновое обновление погоды для всех районов из api.coord
+# Запуск: создаётся и стартует в lifespan приложения (main.py)
+
+import os
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Iterable, Optional
+
+logger = logging.getLogger("refresh")
+
+# Настройки (переопределяются переменными окружения, как и WEATHERBIT_KEY)
+REFRESH_ENABLED = os.getenv("WEATHER_REFRESH", "1") not in ("0", "false", "no", "")
+REFRESH_INTERVAL = float(os.getenv("WEATHER_REFRESH_INTERVAL", "540"))   # период обновления района, сек (< WEATHER_CACHE_TTL)
+REFRESH_RATE = float(os.getenv("WEATHER_REFRESH_RATE", "1"))             # запросов к API в секунду
+REFRESH_JITTER = float(os.getenv("WEATHER_REFRESH_JITTER", "0.2"))       # разброс пауз, доля
+
+
+class Refresher:
+    """
+    Периодически обновляет каждый район с ограничением частоты запросов.
+    Районы обходятся в случайном порядке, паузы между запросами со случайным разбросом,
+    поэтому к API идёт ровный поток запросов, а не всплески раз в interval.
+    Район пропускается, если его данные моложе interval (например, их уже обновил пользовательский запрос).
+    scale() — множитель interval (например, api.ttl_multiplier при нехватке квоты API).
+    """
+
+    def __init__(
+        self,
+        region_ids: Iterable[str],
+        refresh: Callable[[str], Awaitable[dict]],
+        age_of: Callable[[str], Optional[float]],
+        interval: float = REFRESH_INTERVAL,
+        rate: float = REFRESH_RATE,
+        jitter: float = REFRESH_JITTER,
+        scale: Optional[Callable[[], float]] = None,
+    ):
+        self.region_ids = list(region_ids)
+        self._refresh = refresh
+        self._age_of = age_of
+        self.interval = interval
+        self.rate = rate
+        self.jitter = jitter
+        self._scale = scale or (lambda: 1.0)
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed = 0
+        self.failed = 0
+        self.cycles = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+            logger.info("Фоновое обновление запущено: %d районов, период %s с, %s запр/с",
+                        len(self.region_ids), self.interval, self.rate)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _pause(self) -> float:
+        base = 1.0 / self.rate if self.rate > 0 else 0.0
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def _interval(self) -> float:
+        return self.interval * self._scale()
+
+    def _next_due(self) -> float:
+        """Через сколько секунд истечёт interval у самого старого района."""
+        interval = self._interval()
+        wait = interval
+        for region_id in self.region_ids:
+            age = self._age_of(region_id)
+            if age is None:
+                return 1.0
+            wait = min(wait, interval - age)
+        return max(1.0, wait)
+
+    async def _run(self) -> None:
+        while True:
+            order = self.region_ids[:]
+            random.shuffle(order)
+            for region_id in order:
+                age = self._age_of(region_id)
+                if age is not None and age < self._interval():
+                    continue
+                try:
+                    await self._refresh(region_id)
+                    self.refreshed += 1
+                except (ValueError, RuntimeError):
+                    self.failed += 1   # уже залогировано в api
+                except Exception:
+                    # непредвиденная ошибка одного района не должна останавливать обновление остальных
+                    self.failed += 1
+                    logger.exception("Ошибка фонового обновления района %s", region_id)
+                await asyncio.sleep(self._pause())
+            self.cycles += 1
+            # следующий проход — когда устареет первый район (но не чаще раза в секунду)
+            await asyncio.sleep(self._next_due() * (1 + random.uniform(0, self.jitter)))
+
+    def status(self) -> dict:
+        """Сводка и возраст данных по каждому району (секунды или None, если данных ещё нет)."""
+        ages = {}
+        for region_id in self.region_ids:
+            age = self._age_of(region_id)
+            ages[region_id] = None if age is None else round(age, 1)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval": self._interval(),
+            "rate": self.rate,
+            "cycles": self.cycles,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "age": ages,
+        }
@@ -0,0 +1,113 @@
+# stats.py
+# Сводная статистика температуры по областям и по стране
+# Запуск: создаётся в main.py, подписан на обновления через api.add_listener
+
+import math
+from array import array
+from typing import Dict, Optional, Tuple
+
+from lazy import optional
+
+
+def _summarize(ids: Tuple[str, ...], temps: array) -> dict:
+    """mean / min / max / spread и самый тёплый / холодный район по массиву (NaN — нет данных)."""
+    # numpy необязателен (без него — чистый Python) и грузится при первом расчёте, а не при старте
+    np = optional("numpy")
+    if np is not None:
+        v = np.frombuffer(temps, dtype=np.float64)
+        mask = ~np.isnan(v)
+        n = int(mask.sum())
+        if n == 0:
+            return {"count": 0, "total": len(ids)}
+        filled_hi = np.where(mask, v, -np.inf)
+        filled_lo = np.where(mask, v, np.inf)
+        hi, lo = int(filled_hi.argmax()), int(filled_lo.argmin())
+        total = float(v[mask].sum())
+    else:
+        known = [(t, i) for i, t in enumerate(temps) if not math.isnan(t)]
+        n = len(known)
+        if n == 0:
+            return {"count": 0, "total": len(ids)}
+        hi = max(known, key=lambda ti: ti[0])[1]
+        lo = min(known, key=lambda ti: ti[0])[1]
+        total = sum(t for t, _ in known)
+    return {
+        "count": n,
+        "total": len(ids),
+        "sum": total,
+        "mean": round(total / n, 1),
+        "min": temps[lo],
+        "max": temps[hi],
+        "spread": temps[hi] - temps[lo],
+        "warmest": {"region_id": ids[hi], "temp": temps[hi]},
+        "coldest": {"region_id": ids[lo], "temp": temps[lo]},
+    }
+
+
+def _public(summary: dict) -> dict:
+    return {k: v for k, v in summary.items() if k != "sum"}
+
+
+class OblastStats:
+    """
+    Температуры районов хранятся в массиве на область (NaN — данных нет).
+    update() меняет одну ячейку и пересчитывает сводку только этой области,
+    сводка по стране собирается из сводок областей. Запрос получает готовый результат.
+    update() подходит как подписчик api.add_listener: fn(ключ, данные, время).
+    """
+
+    def __init__(self, oblasts: Dict[str, Tuple[str, ...]]):
+        self._ids = {city: tuple(ids) for city, ids in oblasts.items()}
+        self._pos: Dict[str, Tuple[str, int]] = {
+            region_id: (city, i) for city, ids in self._ids.items() for i, region_id in enumerate(ids)
+        }
+        self._temps = {city: array("d", [math.nan] * len(ids)) for city, ids in self._ids.items()}
+        self._oblast = {city: {"count": 0, "total": len(ids)} for city, ids in self._ids.items()}
+        self._country = self._combine()
+
+    def update(self, key: str, data: dict, ts: float = 0.0) -> None:
+        pos = self._pos.get(key)
+        if pos is None:
+            return
+        try:
+            temp = float(data.get("temp"))
+        except (TypeError, ValueError):
+            return
+        city, i = pos
+        temps = self._temps[city]
+        if temps[i] == temp:
+            return
+        temps[i] = temp
+        self._oblast[city] = _summarize(self._ids[city], temps)
+        self._country = self._combine()
+
+    def _combine(self) -> dict:
+        """Сводка по стране из сводок областей (без прохода по всем районам)."""
+        parts = [s for s in self._oblast.values() if s["count"]]
+        total = sum(s["total"] for s in self._oblast.values())
+        if not parts:
+            return {"count": 0, "total": total}
+        n = sum(s["count"] for s in parts)
+        warmest = max(parts, key=lambda s: s["max"])
+        coldest = min(parts, key=lambda s: s["min"])
+        s_sum = sum(s["sum"] for s in parts)
+        return {
+            "count": n,
+            "total": total,
+            "sum": s_sum,
+            "mean": round(s_sum / n, 1),
+            "min": coldest["min"],
+            "max": warmest["max"],
+            "spread": warmest["max"] - coldest["min"],
+            "warmest": warmest["warmest"],
+            "coldest": coldest["coldest"],
+        }
+
+    def summary(self, oblast: Optional[str] = None) -> dict:
+        """{"oblasts": {город: сводка}, "country": сводка}; с oblast — только эта область (KeyError, если нет)."""
+        if oblast is not None:
+            return {"oblasts": {oblast: _public(self._oblast[oblast])}, "country": _public(self._country)}
+        return {
+            "oblasts": {city: _public(s) for city, s in self._oblast.items()},
+            "country": _public(self._country),
+        }
@@ -0,0 +1,158 @@
+# store.py
+# Хранение последних показаний погоды на диске (SQLite) для "тёплого" перезапуска
+# Запуск: создаётся в main.py, загружается и запускается в lifespan приложения
+
+import os
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("store")
+
+# Путь к файлу базы; пустая строка отключает хранение на диске
+STORE_PATH = os.getenv("WEATHER_STORE_PATH", "weather.sqlite3")
+STORE_FLUSH_INTERVAL = float(os.getenv("WEATHER_STORE_FLUSH_INTERVAL", "2"))   # период записи пачки, сек
+
+
+class SnapshotStore:
+    """
+    Последнее показание по каждому ключу: key -> (данные, время получения).
+    put() только кладёт запись в очередь в памяти; на диск пишет фоновая задача
+    пачками в отдельном потоке, поэтому обработчики запросов не ждут диск.
+    База в режиме WAL, её могут одновременно читать и писать несколько воркеров uvicorn.
+    В режиме общего кэша (WEATHER_CACHE_BACKEND=sqlite) это же хранилище служит вторым
+    уровнем кэша (get/save) и даёт межпроцессные блокировки (try_lock/unlock).
+    """
+
+    def __init__(self, path: str, flush_interval: float = STORE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, Tuple[dict, float]] = {}   # key -> последнее несохранённое значение
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " key TEXT PRIMARY KEY, data TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks ("
+                " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def load_all(self) -> List[Tuple[str, dict, float]]:
+        """Все сохранённые записи [(key, данные, время)] (блокирующий вызов)."""
+        with self._lock:
+            rows = self._connect().execute("SELECT key, data, ts FROM snapshots").fetchall()
+        result = []
+        for key, raw, ts in rows:
+            try:
+                result.append((key, json.loads(raw), ts))
+            except ValueError:
+                logger.warning("Повреждённая запись в %s: %s", self.path, key)
+        return result
+
+    def get(self, key: str) -> Optional[Tuple[dict, float]]:
+        """(данные, время получения) для ключа или None (блокирующий вызов)."""
+        with self._lock:
+            row = self._connect().execute("SELECT data, ts FROM snapshots WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0]), row[1]
+        except ValueError:
+            return None
+
+    def save(self, key: str, data: dict, ts: float) -> None:
+        """Записать сразу, минуя очередь (блокирующий вызов), чтобы другие воркеры увидели данные."""
+        self._write({key: (data, ts)})
+
+    def try_lock(self, key: str, owner: str, lease: float) -> bool:
+        """
+        Захватить межпроцессную блокировку ключа на lease секунд.
+        Просроченная блокировка (например, упавшего воркера) перехватывается.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            cur = conn.execute(
+                "INSERT INTO locks (key, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE locks.expires < ? OR locks.owner = excluded.owner",
+                (key, owner, now + lease, now),
+            )
+            conn.commit()
+            return cur.rowcount > 0
+
+    def unlock(self, key: str, owner: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+            conn.commit()
+
+    def put(self, key: str, data: dict, ts: float) -> None:
+        """Поставить запись в очередь на запись (не блокирует)."""
+        self._pending[key] = (data, ts)
+
+    def _write(self, batch: Dict[str, Tuple[dict, float]]) -> None:
+        rows = [(key, json.dumps(data, ensure_ascii=False), ts) for key, (data, ts) in batch.items()]
+        with self._lock:
+            conn = self._connect()
+            # не затираем более свежие данные, записанные другим воркером
+            conn.executemany(
+                "INSERT INTO snapshots (key, data, ts) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, ts = excluded.ts "
+                "WHERE excluded.ts > snapshots.ts",
+                rows,
+            )
+            conn.commit()
+        self.written += len(rows)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except sqlite3.Error as exc:
+            logger.error("Не удалось сохранить %d записей в %s: %s", len(batch), self.path, exc)
+            # вернём несохранённое в очередь, не перетирая более новые значения
+            for key, value in batch.items():
+                self._pending.setdefault(key, value)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
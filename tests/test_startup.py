@@ -0,0 +1,15 @@
+# tests/test_startup.py
+# Холодный старт приложения: импорт main укладывается в бюджет и не тянет тяжёлые модули
+# Запуск: python -m pytest -q (бюджет — IMPORT_BUDGET_MS, по умолчанию importtime.DEFAULT_BUDGET_MS)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import importtime
+
+
+def test_startup_within_budget_and_no_forbidden_imports():
+    assert importtime.DEFAULT_BUDGET_MS > 0
+    assert importtime.main(["--runs", "1", "--forbid", importtime.DEFAULT_FORBID]) == 0